@@ -0,0 +1,933 @@
+""" Asyncio wrapper for the Spider API """
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from types import TracebackType
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Tuple,
+    Type,
+    ValuesView,
+)
+from urllib.parse import unquote, urlencode
+
+import aiohttp
+
+from spiderpy.bulk import BulkReport
+from spiderpy.changes import DeviceChanges, reconcile
+from spiderpy.circuitbreaker import FAILURE_THRESHOLD, RESET_TIMEOUT, Circuits
+from spiderpy.codec import JSON_CODEC, JsonCodec
+from spiderpy.conditional import ConditionalCache
+from spiderpy.devices.base import SpiderDevice
+from spiderpy.devices.powerplug import SpiderPowerPlug
+from spiderpy.devices.thermostat import SpiderThermostat
+from spiderpy.energyhistory import RETENTION, EnergyHistory
+from spiderpy.exceptions import (
+    CircuitOpenException,
+    SpiderApiException,
+    UnauthorizedException,
+)
+from spiderpy.fleet import FleetEnergy
+from spiderpy.metrics import Metrics
+from spiderpy.monitoring import energy_monitoring_path, parse_total_energy
+from spiderpy.scheduler import RefreshSchedule
+from spiderpy.snapshot import Snapshot, read_snapshot, write_snapshot
+from spiderpy.spiderapi import (
+    AUTHENTICATE_PATH,
+    BASE_URL,
+    CLIENT_HEADERS,
+    DEVICES_PATH,
+    ENERGY_CONCURRENCY,
+    ENERGY_DEVICES_PATH,
+    POWER_PLUGS_PATH,
+    REFRESH_RATE,
+    TIMEOUT,
+    DeviceType,
+    encode_username,
+    seconds_since,
+    thermostat_data,
+)
+from spiderpy.subscriptions import ChangeCallback, RefreshCallback, Subscriptions
+
+MAX_CONNECTIONS = 100
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AsyncSpiderApi:
+    """ Asyncio interface class for the Spider API """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        refresh_rate: int = REFRESH_RATE,
+        base_url: str = BASE_URL,
+        session: aiohttp.ClientSession | None = None,
+        max_connections: int = MAX_CONNECTIONS,
+        timeout: float = TIMEOUT,
+        energy_concurrency: int = ENERGY_CONCURRENCY,
+        energy_retention: int = RETENTION,
+        json_codec: JsonCodec = JSON_CODEC,
+        metrics: Metrics | None = None,
+        single_device_reads: bool = False,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        fleet: FleetEnergy | None = None,
+    ) -> None:
+        """ Constructor. Pass a session to share its connection pool between clients
+
+        Every request is given timeout seconds, also on a passed session.
+
+        With single_device_reads, get_thermostat() refreshes only the requested
+        thermostat, through its own endpoint, instead of listing all devices.
+
+        After failure_threshold consecutive failures of an endpoint class, its
+        requests are refused for reset_timeout seconds, doubling while it fails.
+
+        With a fleet, the readings of the power plugs are also kept in its
+        columns, under the username.
+        """
+        self._username = encode_username(username)
+        self._account = username
+        self._fleet = fleet
+        self._password = password
+        self._base_url = base_url.rstrip("/")
+        self._session = session
+        self._owns_session = session is None
+        self._max_connections = max_connections
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._thermostats: Dict[Any, Any] = {}
+        self._power_plugs: Dict[Any, Any] = {}
+        self._thermostat_results: List[Dict[Any, Any]] = []
+        self._power_plug_results: List[Dict[Any, Any]] = []
+        self._due = {"thermostats": 0.0, "power_plugs": 0.0}
+        self._device_due: Dict[str, float] = {}
+        self._single_device_reads = single_device_reads
+        self._access_token: str = ""
+        self._refresh_token: str = ""
+        self._token_expires_at = datetime.now() - timedelta(days=1)
+        self._token_expires_in = None
+        self._refresh_rate: int = refresh_rate
+        self._token_lock = asyncio.Lock()
+        self._conditional = ConditionalCache()
+        self._json = json_codec
+        self._metrics = metrics
+        self._update_locks = {kind: asyncio.Lock() for kind in self._due}
+        self._energy_semaphore = asyncio.Semaphore(energy_concurrency)
+        self._action_semaphore = asyncio.Semaphore(energy_concurrency)
+        self._energy_retention = energy_retention
+        self._energy_history: Dict[str, EnergyHistory] = {}
+        self._subscriptions = Subscriptions()
+        self._thermostats_updated_at: datetime | None = None
+        self._power_plugs_updated_at: datetime | None = None
+        self._refresh_tasks: List[asyncio.Task[None]] = []
+        self._circuits = Circuits(failure_threshold, reset_timeout, metrics=metrics)
+        self._warm_up_task: asyncio.Task[None] | None = None
+
+    async def __aenter__(self) -> AsyncSpiderApi:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """ Close the session, unless it was passed in by the caller """
+        await self.stop_background_refresh()
+
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            await asyncio.gather(self._warm_up_task, return_exceptions=True)
+            self._warm_up_task = None
+
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def thermostats_updated_at(self) -> datetime | None:
+        """ When the thermostats were last refreshed """
+        return self._thermostats_updated_at
+
+    @property
+    def power_plugs_updated_at(self) -> datetime | None:
+        """ When the power plugs were last refreshed """
+        return self._power_plugs_updated_at
+
+    @property
+    def background_refresh(self) -> bool:
+        return bool(self._refresh_tasks)
+
+    @property
+    def thermostats_age(self) -> float | None:
+        """ Seconds since the thermostats were last refreshed """
+        return seconds_since(self._thermostats_updated_at)
+
+    @property
+    def power_plugs_age(self) -> float | None:
+        """ Seconds since the power plugs were last refreshed """
+        return seconds_since(self._power_plugs_updated_at)
+
+    @property
+    def stale(self) -> bool:
+        """ Whether the cache holds devices that could not be refreshed
+
+        That is the case for devices restored from a snapshot, and for the last
+        good devices served while the API fails.
+        """
+        return bool(self._circuits.stale)
+
+    @property
+    def circuits(self) -> Dict[str, str]:
+        """ State of the circuit breaker of every endpoint class """
+        return self._circuits.states
+
+    def save_snapshot(self, path: str) -> None:
+        """ Write the cached devices and energy usage to disk, to restore after a restart """
+        write_snapshot(
+            path,
+            Snapshot.capture(
+                self._thermostats.values(),
+                self._power_plugs.values(),
+                self._energy_history,
+            ),
+        )
+
+    def restore_snapshot(self, path: str) -> bool:
+        """ Serve the devices of a snapshot right away and refresh them in a background task
+
+        Only an empty cache is restored. Until the refresh is done, stale is true
+        and the updated_at properties tell when the snapshot was taken.
+        """
+        if self._thermostats or self._power_plugs:
+            return False
+
+        snapshot = read_snapshot(path)
+        if snapshot is None:
+            return False
+
+        self._energy_history = snapshot.restore_energy_history(self._energy_retention)
+        self._thermostats = {
+            data["id"]: SpiderThermostat(data) for data in snapshot.thermostats
+        }
+        self._power_plugs = {
+            data["id"]: self._create_power_plug(data) for data in snapshot.power_plugs
+        }
+        self._update_fleet()
+        self._thermostats_updated_at = datetime.fromtimestamp(snapshot.saved_at)
+        self._power_plugs_updated_at = datetime.fromtimestamp(snapshot.saved_at)
+        self._circuits.stale = {"thermostats", "power_plugs"}
+
+        # Getters return the snapshot instead of waiting for the refresh
+        for kind in self._due:
+            self._due[kind] = time.monotonic() + self._refresh_rate
+
+        self._warm_up_task = asyncio.create_task(self._refresh_restored())
+        return True
+
+    async def _refresh_restored(self) -> None:
+        for kind in ("thermostats", "power_plugs"):
+            try:
+                await getattr(self, "update_" + kind)()
+            except Exception:  # pylint: disable=broad-except
+                # Let the next getter try again
+                self._due[kind] = 0.0
+                _LOGGER.exception(f"Unable to refresh the restored {kind}")
+
+    def start_background_refresh(
+        self,
+        thermostat_interval: float | None = None,
+        power_plug_interval: float | None = None,
+    ) -> None:
+        """ Refresh ahead of expiry in background tasks, getters then return the cache """
+        if self._refresh_tasks:
+            return
+
+        self._refresh_tasks = [
+            asyncio.create_task(
+                self._background_refresh(
+                    self.update_thermostats,
+                    RefreshSchedule(thermostat_interval or self._refresh_rate),
+                )
+            ),
+            asyncio.create_task(
+                self._background_refresh(
+                    self.update_power_plugs,
+                    RefreshSchedule(power_plug_interval or self._refresh_rate),
+                )
+            ),
+        ]
+
+    async def stop_background_refresh(self) -> None:
+        for task in self._refresh_tasks:
+            task.cancel()
+        await asyncio.gather(*self._refresh_tasks, return_exceptions=True)
+        self._refresh_tasks = []
+
+    @staticmethod
+    async def _background_refresh(
+        refresh: Callable[[], Awaitable[Any]], schedule: RefreshSchedule
+    ) -> None:
+        while True:
+            await asyncio.sleep(schedule.delay(time.monotonic()))
+            try:
+                await refresh()
+                schedule.succeeded(time.monotonic())
+            except Exception:  # pylint: disable=broad-except
+                schedule.failed(time.monotonic())
+                _LOGGER.exception(
+                    f"Background refresh failed {schedule.failures} time(s)"
+                )
+
+    async def update(self) -> None:
+        """ Update the cache. Concurrent callers share a single refresh """
+        await asyncio.gather(
+            self._update_kind("thermostats"), self._update_kind("power_plugs")
+        )
+
+    async def _update_kind(self, kind: str) -> None:
+        """ Refresh one class of devices, when it is due """
+        async with self._update_locks[kind]:
+            if time.monotonic() >= self._due[kind]:
+                await getattr(self, "update_" + kind)()
+
+    def _refresh_on_read(self, kind: str) -> bool:
+        """ Getters refresh without background refresh, or when the cache was never filled """
+        if getattr(self, "_" + kind + "_updated_at") is None:
+            return True
+
+        return not self.background_refresh
+
+    async def _refresh_for_read(self, kind: str) -> None:
+        """ Refresh before a read, serving the last good devices when that fails """
+        try:
+            await self._update_kind(kind)
+        except (SpiderApiException, UnauthorizedException) as exception:
+            if getattr(self, "_" + kind + "_updated_at") is None:
+                raise
+
+            self._circuits.serve_stale(kind, exception)
+
+    def subscribe(
+        self,
+        callback: ChangeCallback,
+        device_id: str | None = None,
+        field: str | None = None,
+    ) -> Callable[[], None]:
+        """ Call back with (device, field, old value, new value) when a refresh changes a value
+
+        Limit it to one device and/or field, such as SetpointTemperature,
+        OperationMode, isSwitchedOn or currentUsage. Returns a function to unsubscribe.
+        """
+        return self._subscriptions.subscribe(callback, device_id, field)
+
+    def on_refresh(self, callback: RefreshCallback) -> Callable[[], None]:
+        """ Call back with (kind, devices) after every refresh, whether it changed anything or not
+
+        Kind is thermostats or power_plugs. Returns a function to stop.
+        """
+        return self._subscriptions.listen(callback)
+
+    async def changes(
+        self, device_id: str | None = None, field: str | None = None
+    ) -> AsyncIterator[Tuple[SpiderDevice, str, Any, Any]]:
+        """ Iterate over the changes found by refreshes, as (device, field, old, new) """
+        queue: asyncio.Queue[Tuple[SpiderDevice, str, Any, Any]] = asyncio.Queue()
+        unsubscribe = self.subscribe(
+            lambda *change: queue.put_nowait(change), device_id, field
+        )
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            unsubscribe()
+
+    async def update_thermostats(self) -> DeviceChanges:
+        """ Retrieve thermostats and update the cached ones in place """
+        results = await self._request_update(
+            self._base_url + DEVICES_PATH, "devices", True
+        )
+        self._due["thermostats"] = time.monotonic() + self._refresh_rate
+
+        if results is None:
+            if not self._has_pending(self._thermostats):
+                self._thermostats_updated_at = datetime.now()
+                self._circuits.stale.discard("thermostats")
+                self._subscriptions.refreshed("thermostats", self._thermostats.values())
+                return DeviceChanges()
+
+            # Reconcile the unchanged listing, so pending changes can expire
+            results = self._thermostat_results
+        else:
+            self._thermostat_results = results
+
+        started = time.perf_counter()
+        thermostats = {
+            thermostat["id"]: thermostat_data(thermostat)
+            for thermostat in results
+            if thermostat["type"] == 105
+        }
+
+        self._thermostats, changes = reconcile(
+            self._thermostats, thermostats, SpiderThermostat
+        )
+        if self._metrics is not None:
+            self._metrics.stage("build", time.perf_counter() - started)
+        self._thermostats_updated_at = datetime.now()
+        self._circuits.stale.discard("thermostats")
+        self._subscriptions.notify(self._thermostats, changes)
+        self._subscriptions.refreshed("thermostats", self._thermostats.values())
+
+        return changes
+
+    async def update_thermostat(self, unique_id: str) -> DeviceChanges:
+        """ Retrieve a single thermostat and update the cached one in place """
+        result = await self._request_update(
+            self._base_url + DEVICES_PATH + "/" + unique_id, "thermostat", True
+        )
+        self._device_due[unique_id] = time.monotonic() + self._refresh_rate
+
+        current = self._thermostats.get(unique_id)
+        if result is None:
+            if current is not None:
+                self._subscriptions.refreshed("thermostats", [current])
+            return DeviceChanges()
+
+        updated, changes = reconcile(
+            {} if current is None else {unique_id: current},
+            {unique_id: result},
+            SpiderThermostat,
+        )
+        # No await between reading and replacing the mapping, so a listing
+        # refresh cannot interleave and be overwritten
+        self._thermostats = {**self._thermostats, **updated}
+        self._subscriptions.notify(self._thermostats, changes)
+        self._subscriptions.refreshed("thermostats", updated.values())
+
+        return changes
+
+    async def get_thermostats(self) -> ValuesView[SpiderThermostat]:
+        """ Get all thermostats """
+        if self._refresh_on_read("thermostats"):
+            await self._refresh_for_read("thermostats")
+
+        return self._thermostats.values()
+
+    async def get_thermostat(self, unique_id: str) -> SpiderThermostat | None:
+        """ Get a thermostat by id """
+        if self._refresh_on_read("thermostats"):
+            if self._single_device_reads and unique_id in self._thermostats:
+                await self._update_single_thermostat(unique_id)
+            else:
+                await self._refresh_for_read("thermostats")
+
+        if unique_id in self._thermostats:
+            return self._thermostats[unique_id]
+
+        return None
+
+    async def _update_single_thermostat(self, unique_id: str) -> None:
+        """ Refresh a known thermostat, when neither it nor the listing is fresh """
+        now = time.monotonic()
+        if now < self._due["thermostats"] or now < self._device_due.get(unique_id, 0):
+            return
+
+        try:
+            await self.update_thermostat(unique_id)
+        except SpiderApiException:
+            # It may have been removed, the listing tells
+            await self._refresh_for_read("thermostats")
+
+    async def set_temperature(
+        self, thermostat: SpiderThermostat, temperature: float
+    ) -> bool:
+        """ Set the temperature. Unfortunately, the API requires the complete object """
+        if thermostat.set_temperature(temperature):
+            url = self._base_url + DEVICES_PATH + "/" + thermostat.id
+            try:
+                await self._request_action(
+                    url, self._json.dumps(thermostat.data), "thermostat"
+                )
+                return True
+            except SpiderApiException:
+                thermostat.clear_pending("SetpointTemperature")
+                _LOGGER.error(f"Unable to set temperature to {temperature}.")
+        return False
+
+    async def set_operation_mode(
+        self, thermostat: SpiderThermostat, operation_mode: str
+    ) -> bool:
+        """ Set the operation mode. Unfortunately, the API requires the complete object """
+        if thermostat.set_operation_mode(operation_mode):
+            url = self._base_url + DEVICES_PATH + "/" + thermostat.id
+            try:
+                await self._request_action(
+                    url, self._json.dumps(thermostat.data), "thermostat"
+                )
+                return True
+            except SpiderApiException:
+                thermostat.clear_pending("OperationMode")
+                _LOGGER.error(
+                    f"Unable to set operation mode to {operation_mode}. Is this operation mode supported?"
+                )
+        return False
+
+    async def set_fan_speed(self, thermostat: SpiderThermostat, fan_speed: str) -> bool:
+        """ Set the fan speed. Unfortunately, the API requires the complete object """
+        if thermostat.set_fan_speed(fan_speed):
+            url = self._base_url + DEVICES_PATH + "/" + thermostat.id
+            try:
+                await self._request_action(
+                    url, self._json.dumps(thermostat.data), "thermostat"
+                )
+                return True
+            except SpiderApiException:
+                thermostat.clear_pending("FanSpeed")
+                _LOGGER.error(
+                    f"Unable to set fan speed to {fan_speed}. Is this fan speed supported?"
+                )
+        return False
+
+    async def set_temperatures(
+        self, thermostats: Iterable[SpiderThermostat], temperature: float
+    ) -> BulkReport:
+        """ Set the temperature of many thermostats, with concurrent requests """
+
+        async def set_temperature(thermostat: SpiderThermostat) -> None:
+            await self._change_thermostat(
+                thermostat,
+                "SetpointTemperature",
+                lambda: thermostat.set_temperature(temperature),
+            )
+
+        return await self._bulk(thermostats, set_temperature)
+
+    async def set_operation_modes(
+        self, thermostats: Iterable[SpiderThermostat], operation_mode: str
+    ) -> BulkReport:
+        """ Set the operation mode of many thermostats, with concurrent requests """
+
+        async def set_operation_mode(thermostat: SpiderThermostat) -> None:
+            await self._change_thermostat(
+                thermostat,
+                "OperationMode",
+                lambda: thermostat.set_operation_mode(operation_mode),
+            )
+
+        return await self._bulk(thermostats, set_operation_mode)
+
+    async def _change_thermostat(
+        self, thermostat: SpiderThermostat, field: str, change: Callable[[], bool]
+    ) -> None:
+        if not change():
+            raise SpiderApiException(
+                f"Unable to change {field} of {thermostat.id}. Is it online and supported?"
+            )
+
+        url = self._base_url + DEVICES_PATH + "/" + thermostat.id
+        try:
+            await self._request_action(
+                url, self._json.dumps(thermostat.data), "thermostat"
+            )
+        except SpiderApiException:
+            thermostat.clear_pending(field)
+            raise
+
+    async def update_power_plugs(self) -> DeviceChanges:
+        """ Retrieve power plugs and update the cached ones in place """
+        results = await self._request_update(
+            self._base_url + ENERGY_DEVICES_PATH, "energy_devices", True
+        )
+        self._due["power_plugs"] = time.monotonic() + self._refresh_rate
+
+        if results is None:
+            results = self._power_plug_results
+        else:
+            self._power_plug_results = results
+
+        # Copies, the cached power plugs keep their own data
+        power_plugs = [dict(plug) for plug in results if plug["isSwitch"]]
+        energy_requests = await asyncio.gather(
+            *[self._request_energy_usage(power_plug) for power_plug in power_plugs]
+        )
+
+        for power_plug, today_usage in zip(power_plugs, energy_requests):
+            if today_usage is None:
+                # Keep the usage of the previous refresh
+                previous = self._power_plugs.get(power_plug["id"])
+                if previous is not None and "todayUsage" in previous.data:
+                    power_plug["todayUsage"] = previous.data["todayUsage"]
+            else:
+                power_plug["todayUsage"] = today_usage
+
+        started = time.perf_counter()
+        self._power_plugs, changes = reconcile(
+            self._power_plugs,
+            {power_plug["id"]: power_plug for power_plug in power_plugs},
+            self._create_power_plug,
+        )
+        if self._metrics is not None:
+            self._metrics.stage("build", time.perf_counter() - started)
+        self._power_plugs_updated_at = datetime.now()
+        self._update_fleet()
+        self._circuits.stale.discard("power_plugs")
+        self._subscriptions.notify(self._power_plugs, changes)
+        self._subscriptions.refreshed("power_plugs", self._power_plugs.values())
+
+        return changes
+
+    async def _request_energy_usage(self, power_plug: Dict[Any, Any]) -> float | None:
+        """ Retrieve the energy usage of a power plug since the previous refresh """
+        energy_device_id = power_plug["energyDeviceId"]
+        history = self._energy_history.setdefault(
+            energy_device_id, EnergyHistory(self._energy_retention)
+        )
+        now = int(time.time())
+
+        async with self._energy_semaphore:
+            for start, take in history.windows(now):
+                energy_url = self._base_url + energy_monitoring_path(
+                    energy_device_id, start, take
+                )
+                try:
+                    energy = parse_total_energy(
+                        await self._request_update(energy_url, "monitoring")
+                    )
+                except IndexError:
+                    # No buckets yet, such as for the bucket that just opened
+                    continue
+                except SpiderApiException as exception:
+                    _LOGGER.error(
+                        f"Unable to get today energy usage of {energy_device_id}: {exception}"
+                    )
+                    return None
+
+                history.record(start, energy, take)
+
+        return history.today(now)
+
+    def _update_fleet(self) -> None:
+        if self._fleet is not None:
+            self._fleet.update(self._account, self._power_plugs.values())
+
+    @staticmethod
+    def _has_pending(devices: Dict[Any, Any]) -> bool:
+        return any(device.pending for device in devices.values())
+
+    def _create_power_plug(self, data: Dict[Any, Any]) -> SpiderPowerPlug:
+        return SpiderPowerPlug(data, self._energy_history.get(data["energyDeviceId"]))
+
+    async def get_power_plugs(self) -> ValuesView[SpiderPowerPlug]:
+        """ Get all power plugs """
+        if self._refresh_on_read("power_plugs"):
+            await self._refresh_for_read("power_plugs")
+
+        return self._power_plugs.values()
+
+    async def get_power_plug(self, unique_id: str) -> SpiderPowerPlug | None:
+        """ Get a power plug by id """
+        if self._refresh_on_read("power_plugs"):
+            await self._refresh_for_read("power_plugs")
+
+        if unique_id in self._power_plugs:
+            return self._power_plugs[unique_id]
+
+        return None
+
+    async def turn_power_plug_on(self, power_plug: SpiderPowerPlug) -> bool:
+        """ Turn the power_plug on """
+        if power_plug.turn_on():
+            url = self._base_url + POWER_PLUGS_PATH + "/" + power_plug.id + "/switch"
+            try:
+                await self._request_action(url, "true", "power_plug_switch")
+                return True
+            except SpiderApiException:
+                power_plug.clear_pending("isSwitchedOn")
+                _LOGGER.error("Unable to turn power plug on.")
+        return False
+
+    async def turn_power_plug_off(self, power_plug: SpiderPowerPlug) -> bool:
+        """ Turn the power plug off """
+        if power_plug.turn_off():
+            url = self._base_url + POWER_PLUGS_PATH + "/" + power_plug.id + "/switch"
+            try:
+                await self._request_action(url, "false", "power_plug_switch")
+                return True
+            except SpiderApiException:
+                power_plug.clear_pending("isSwitchedOn")
+                _LOGGER.error("Unable to turn power plug off.")
+        return False
+
+    async def turn_power_plugs_on(
+        self, power_plugs: Iterable[SpiderPowerPlug]
+    ) -> BulkReport:
+        """ Turn many power plugs on, with concurrent requests """
+        return await self._bulk(
+            power_plugs, lambda power_plug: self._switch(power_plug, True)
+        )
+
+    async def turn_power_plugs_off(
+        self, power_plugs: Iterable[SpiderPowerPlug]
+    ) -> BulkReport:
+        """ Turn many power plugs off, with concurrent requests """
+        return await self._bulk(
+            power_plugs, lambda power_plug: self._switch(power_plug, False)
+        )
+
+    async def _switch(self, power_plug: SpiderPowerPlug, on: bool) -> None:
+        if not (power_plug.turn_on() if on else power_plug.turn_off()):
+            raise SpiderApiException(f"Unable to switch {power_plug.id}. Is it online?")
+
+        url = self._base_url + POWER_PLUGS_PATH + "/" + power_plug.id + "/switch"
+        try:
+            await self._request_action(
+                url, "true" if on else "false", "power_plug_switch"
+            )
+        except SpiderApiException:
+            power_plug.clear_pending("isSwitchedOn")
+            raise
+
+    async def _bulk(
+        self,
+        devices: Iterable[DeviceType],
+        action: Callable[[DeviceType], Awaitable[None]],
+    ) -> BulkReport:
+        """ Perform the action for every device, at most energy_concurrency at a time """
+        devices = list(devices)
+
+        async def perform(device: DeviceType) -> None:
+            async with self._action_semaphore:
+                await action(device)
+
+        outcomes = await asyncio.gather(
+            *[perform(device) for device in devices], return_exceptions=True
+        )
+
+        report = BulkReport()
+        for device, outcome in zip(devices, outcomes):
+            if isinstance(outcome, Exception):
+                _LOGGER.error(f"Unable to update {device.id}: {outcome}")
+                report.failed[device.id] = outcome
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                report.succeeded.append(device.id)
+
+        return report
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """ Lazily create the session, it has to be created inside the event loop """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_connections),
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def _is_authenticated(self) -> bool:
+        """ Check if access token is expired. Concurrent callers share one login """
+        async with self._token_lock:
+            if self._refresh_token == "":
+                await self._request_login()
+                if self._metrics is not None:
+                    self._metrics.token_renewed("login")
+
+            if datetime.now() > self._token_expires_at:
+                await self._refresh_access_token()
+                if self._metrics is not None:
+                    self._metrics.token_renewed("refresh")
+                return True
+
+        return False
+
+    async def _send(
+        self, method: str, url: str, endpoint: str, **kwargs: Any
+    ) -> Tuple[int, Mapping[str, str], bytes]:
+        """ Send a request within the circuit breaker, returning status, headers and body """
+        with self._circuits.request(method, endpoint) as exchange:
+            async with self._get_session().request(
+                method, url, timeout=self._timeout, **kwargs
+            ) as response:
+                headers = response.headers
+                body = await response.read()
+                exchange.bytes_sent = body_size(kwargs.get("data"))
+                exchange.bytes_received = len(body)
+                exchange.status = response.status
+
+        return response.status, headers, body
+
+    async def _request_action(self, url: str, data: str | bytes, endpoint: str) -> None:
+        """ Perform a request to execute an action """
+        await self._is_authenticated()
+
+        headers = {
+            "authorization": "Bearer " + self._access_token,
+            "Content-Type": "application/json",
+            **CLIENT_HEADERS,
+        }
+
+        try:
+            status, _, _ = await self._send(
+                "PUT", url, endpoint, data=data, headers=headers
+            )
+        except CircuitOpenException:
+            raise
+        except Exception as exception:
+            raise SpiderApiException(exception) from exception
+
+        if status == 401:
+            raise SpiderApiException("Access denied. Failed to refresh?")
+
+        if status != 200:
+            if isinstance(data, bytes):
+                data = data.decode()
+            raise SpiderApiException(
+                f"Unable to perform action. Status code: {status}. Data: {data}"
+            )
+
+    async def _request_update(
+        self, url: str, endpoint: str, conditional: bool = False
+    ) -> Any:
+        """ Perform a request to update information
+
+        When conditional, None is returned if the response did not change since
+        the previous request.
+        """
+        await self._is_authenticated()
+
+        headers = {
+            "authorization": "Bearer " + self._access_token,
+            "Content-Type": "application/json",
+            **CLIENT_HEADERS,
+        }
+        if conditional:
+            headers.update(self._conditional.headers(url))
+
+        try:
+            status, response_headers, body = await self._send(
+                "GET", url, endpoint, headers=headers
+            )
+        except CircuitOpenException:
+            raise
+        except Exception as exception:
+            raise SpiderApiException(exception) from exception
+
+        if status == 401:
+            raise SpiderApiException("Access denied. Failed to refresh?")
+
+        if status not in (200, 304):
+            raise SpiderApiException(f"Unable to request update. Status code: {status}")
+
+        if conditional:
+            unchanged = self._conditional.unchanged(url, status, response_headers, body)
+            if self._metrics is not None:
+                self._metrics.cache(endpoint, unchanged)
+            if unchanged:
+                return None
+
+        if status == 304:
+            raise SpiderApiException(
+                "Unable to request update. Not modified, but no previous response"
+            )
+
+        if self._metrics is None:
+            return self._json.loads(body)
+
+        started = time.perf_counter()
+        results = self._json.loads(body)
+        self._metrics.stage("parse", time.perf_counter() - started)
+        return results
+
+    async def _request_login(self) -> None:
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            **CLIENT_HEADERS,
+        }
+
+        payload = {
+            "grant_type": "password",
+            "username": self._username,
+            "password": self._password,
+        }
+
+        try:
+            status, _, body = await self._send(
+                "POST",
+                self._base_url + AUTHENTICATE_PATH,
+                "tokens",
+                data=payload,
+                headers=headers,
+            )
+        except CircuitOpenException:
+            raise
+        except Exception as exception:
+            raise UnauthorizedException(exception) from exception
+
+        if status != 200:
+            raise SpiderApiException(f"Unable to request login. Status code: {status}")
+
+        self._store_tokens(self._json.loads(body))
+
+    async def _refresh_access_token(self) -> None:
+        """ Refresh access_token """
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            **CLIENT_HEADERS,
+        }
+
+        payload = {"grant_type": "refresh_token", "refresh_token": self._refresh_token}
+
+        try:
+            status, _, body = await self._send(
+                "POST",
+                self._base_url + AUTHENTICATE_PATH,
+                "tokens",
+                data=payload,
+                headers=headers,
+            )
+        except CircuitOpenException:
+            raise
+        except Exception as exception:
+            raise SpiderApiException(exception) from exception
+
+        if status != 200:
+            raise SpiderApiException(
+                f"Unable to refresh access token. Status code: {status}"
+            )
+
+        self._store_tokens(self._json.loads(body))
+
+    def _store_tokens(self, data: Dict[Any, Any]) -> None:
+        self._access_token = data["access_token"]
+        self._refresh_token = unquote(data["refresh_token"])
+        self._token_expires_in = data["expires_in"]
+        self._token_expires_at = datetime.now() + timedelta(
+            0, (int(data["expires_in"]) - 20)
+        )
+
+
+def body_size(data: Any) -> int:
+    """ Size in bytes of a request body, as aiohttp encodes it """
+    if data is None:
+        return 0
+    if isinstance(data, Mapping):
+        data = urlencode(data)
+    if isinstance(data, str):
+        data = data.encode()
+
+    return len(data)
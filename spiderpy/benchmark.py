@@ -0,0 +1,572 @@
+""" Benchmarks of SpiderApi against the local fake Spider API """
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from importlib import metadata
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import requests
+
+from spiderpy.codec import JSON_CODEC, JsonCodec, OrjsonCodec
+from spiderpy.devices.compact import CompactPowerPlug, CompactThermostat
+from spiderpy.devices.powerplug import SpiderPowerPlug
+from spiderpy.devices.thermostat import SpiderThermostat
+from spiderpy.energyhistory import BUCKET_SIZE, EnergyHistory, day_start
+from spiderpy.fakeserver import FakeSpiderServer, fake_power_plug
+from spiderpy.fleet import PERCENTILES, FleetEnergy, numpy
+from spiderpy.session import create_session
+from spiderpy.spiderapi import ENERGY_CONCURRENCY, SpiderApi, SpiderApiException
+
+
+def timings(function: Callable[[], Any], rounds: int) -> Dict[str, float]:
+    """ Summary of the duration of rounds calls, in milliseconds """
+    durations: List[float] = []
+    errors = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        try:
+            function()
+        except SpiderApiException:
+            errors += 1
+        durations.append((time.perf_counter() - started) * 1000)
+
+    durations.sort()
+    return {
+        "errors": errors,
+        "min_ms": durations[0],
+        "median_ms": statistics.median(durations),
+        "p95_ms": durations[int(0.95 * (len(durations) - 1))],
+        "max_ms": durations[-1],
+    }
+
+
+def per_second(function: Callable[[], Any], duration: float) -> float:
+    """ Calls of function per second, repeating it for duration seconds """
+    calls = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        function()
+        calls += 1
+
+    return calls / (time.perf_counter() - started)
+
+
+def refresh_cycle(server: FakeSpiderServer, rounds: int) -> Dict[str, Any]:
+    """ Refreshing all devices, with and without changes on the server """
+    with SpiderApi("benchmark", "benchmark", base_url=server.url) as api:
+        started = time.perf_counter()
+        api.update_thermostats()
+        api.update_power_plugs()
+        cold_ms = (time.perf_counter() - started) * 1000
+
+        def unchanged() -> None:
+            api.update_thermostats()
+            api.update_power_plugs()
+
+        def changed() -> None:
+            server.change()
+            api.update_thermostats()
+            api.update_power_plugs()
+
+        return {
+            "cold_ms": cold_ms,
+            "unchanged": timings(unchanged, rounds),
+            "changed": timings(changed, rounds),
+        }
+
+
+def changed_refreshes(
+    server: FakeSpiderServer, session: requests.Session, rounds: int
+) -> Dict[str, float]:
+    """ Refreshing all devices after changes on the server, over the given session """
+    with SpiderApi(
+        "benchmark", "benchmark", base_url=server.url, session=session
+    ) as api:
+
+        def changed() -> None:
+            server.change()
+            api.update_thermostats()
+            api.update_power_plugs()
+
+        # Log in first, so the token request is left out of the timings
+        changed()
+        return timings(changed, rounds)
+
+
+def connection_reuse(server: FakeSpiderServer, rounds: int) -> Dict[str, Any]:
+    """ Refreshing over the pooled keep-alive session, and over a new connection per request """
+    results = {}
+    for name, keep_alive in (("pooled", True), ("connection_per_request", False)):
+        with create_session() as session:
+            if not keep_alive:
+                # The fake server closes the connection after responding
+                session.headers["Connection"] = "close"
+            results[name] = changed_refreshes(server, session, rounds)
+
+    return results
+
+
+def getter_throughput(server: FakeSpiderServer, duration: float) -> Dict[str, Any]:
+    """ Getter calls per second on a fresh cache """
+    with SpiderApi("benchmark", "benchmark", base_url=server.url) as api:
+        thermostat_ids = [thermostat.id for thermostat in api.get_thermostats()]
+        power_plug_ids = [power_plug.id for power_plug in api.get_power_plugs()]
+
+        results = {}
+        for name, getter, ids in (
+            ("get_thermostat", api.get_thermostat, thermostat_ids),
+            ("get_power_plug", api.get_power_plug, power_plug_ids),
+        ):
+            calls = 0
+            started = time.perf_counter()
+            while ids and time.perf_counter() - started < duration:
+                for unique_id in ids:
+                    getter(unique_id)
+                calls += len(ids)
+            results[name + "_per_second"] = calls / (time.perf_counter() - started)
+
+        return results
+
+
+THERMOSTAT_PROPERTIES = (
+    "current_operation_mode",
+    "has_operation_mode",
+    "available_operation_modes",
+    "current_fan_speed_mode",
+    "has_fan_speed_mode",
+    "available_fan_speed_modes",
+    "current_temperature",
+    "target_temperature",
+    "minimum_temperature",
+    "maximum_temperature",
+    "temperature_steps",
+)
+
+
+class LinearScanThermostat(SpiderThermostat):
+    """ Thermostat looking up each property by scanning the list, as before the index """
+
+    def get_property(self, property_id: str) -> Dict[Any, Any] | None:
+        for prop in self.properties:
+            if prop["id"] == property_id:
+                return prop
+
+        return None
+
+
+def read_properties(thermostats: List[SpiderThermostat]) -> None:
+    """ Read every property of the thermostats, and format them """
+    for thermostat in thermostats:
+        for name in THERMOSTAT_PROPERTIES:
+            getattr(thermostat, name)
+        str(thermostat)
+
+
+def property_reads(server: FakeSpiderServer, duration: float) -> Dict[str, Any]:
+    """ Thermostats of which every property is read per second, with the index and with a linear scan """
+    with SpiderApi("benchmark", "benchmark", base_url=server.url) as api:
+        data = [thermostat.data for thermostat in api.get_thermostats()]
+
+    results = {}
+    for name, thermostat_class in (
+        ("indexed", SpiderThermostat),
+        ("linear_scan", LinearScanThermostat),
+    ):
+        thermostats = [thermostat_class(thermostat) for thermostat in data]
+        sweeps = per_second(partial(read_properties, thermostats), duration)
+        results[name + "_per_second"] = sweeps * len(thermostats)
+
+    return results
+
+
+def expired_reads(server: FakeSpiderServer, rounds: int) -> Dict[str, Any]:
+    """ Getter calls finding their data expired, for one class of devices at a time """
+    results = {}
+    for name, single_device_reads in (
+        ("get_thermostat", False),
+        ("get_thermostat_single_device", True),
+        ("get_power_plug", False),
+    ):
+        with SpiderApi(
+            "benchmark",
+            "benchmark",
+            refresh_rate=0,
+            base_url=server.url,
+            single_device_reads=single_device_reads,
+        ) as api:
+            getter: Callable[[str], Any]
+            if name == "get_power_plug":
+                unique_id = next(iter(api.get_power_plugs())).id
+                getter = api.get_power_plug
+            else:
+                unique_id = next(iter(api.get_thermostats())).id
+                getter = api.get_thermostat
+
+            def read() -> None:
+                server.change()
+                getter(unique_id)
+
+            results[name] = timings(read, rounds)
+
+    return results
+
+
+def action_latency(server: FakeSpiderServer, rounds: int) -> Dict[str, Any]:
+    """ Round trip of changing a thermostat and switching a power plug """
+    with SpiderApi("benchmark", "benchmark", base_url=server.url) as api:
+        thermostat = next(iter(api.get_thermostats()))
+        power_plug = next(iter(api.get_power_plugs()))
+        temperatures = iter([19.0, 20.0] * rounds)
+
+        def switch() -> None:
+            if power_plug.is_on:
+                api.turn_power_plug_off(power_plug)
+            else:
+                api.turn_power_plug_on(power_plug)
+
+        return {
+            "set_temperature": timings(
+                lambda: api.set_temperature(thermostat, next(temperatures)), rounds
+            ),
+            "switch_power_plug": timings(switch, rounds),
+        }
+
+
+def memory_per_device(server: FakeSpiderServer) -> Dict[str, Any]:
+    """ Python memory held per cached device, in bytes """
+    session = create_session()
+    executor = ThreadPoolExecutor(max_workers=ENERGY_CONCURRENCY)
+
+    def client() -> SpiderApi:
+        return SpiderApi(
+            "benchmark",
+            "benchmark",
+            base_url=server.url,
+            session=session,
+            executor=executor,
+        )
+
+    # Open the shared connections and start the workers, so they are not counted
+    with client() as api:
+        api.update_thermostats()
+        api.update_power_plugs()
+
+    results = {}
+    for kind, count in (
+        ("thermostat", len(server.thermostats)),
+        ("power_plug", len(server.power_plugs)),
+    ):
+        with client() as api:
+            # The other kind first, so logging in is not counted either
+            if kind == "thermostat":
+                warm_up, measured = api.update_power_plugs, api.update_thermostats
+            else:
+                warm_up, measured = api.update_thermostats, api.update_power_plugs
+            warm_up()
+
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            measured()
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+            grown = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+            results["bytes_per_" + kind] = grown / count if count else 0.0
+
+    executor.shutdown()
+    session.close()
+    return results
+
+
+COMPACT_COPIES = 1000
+
+
+def read_attributes(devices: Sequence[Any], names: Sequence[str]) -> None:
+    """ Read the named attributes of every device """
+    for device in devices:
+        for name in names:
+            getattr(device, name)
+
+
+def build_devices(device_class: Callable[[Any], Any], payloads: List[str]) -> List[Any]:
+    """ A device of the class for each payload """
+    return [device_class(json.loads(payload)) for payload in payloads]
+
+
+def allocated(build: Callable[[], List[Any]]) -> Tuple[List[Any], int]:
+    """ The built devices, and the bytes still allocated for them once built """
+    tracemalloc.start()
+    devices = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return devices, size
+
+
+def compact_devices(server: FakeSpiderServer, duration: float) -> Dict[str, Any]:
+    """ Memory per device and attribute reads per second, of the regular and the compact devices """
+    with SpiderApi("benchmark", "benchmark", base_url=server.url) as api:
+        payloads = {
+            "thermostat": [
+                json.dumps(thermostat.data) for thermostat in api.get_thermostats()
+            ],
+            "power_plug": [
+                json.dumps(power_plug.data) for power_plug in api.get_power_plugs()
+            ],
+        }
+
+    results: Dict[str, Any] = {}
+    for kind, regular_class, compact_class in (
+        ("thermostat", SpiderThermostat, CompactThermostat),
+        ("power_plug", SpiderPowerPlug, CompactPowerPlug),
+    ):
+        # The attributes of both are named after the properties of the regular device
+        names = [name for name in compact_class.__slots__ if not name.startswith("_")]
+        # Enough copies of the devices for a stable size per device
+        repeat = COMPACT_COPIES // len(payloads[kind]) + 1 if payloads[kind] else 0
+        copies = payloads[kind] * repeat
+        results[kind] = {}
+        for name, device_class in (
+            ("regular", regular_class),
+            ("compact", compact_class),
+        ):
+            devices, size = allocated(partial(build_devices, device_class, copies))
+            sweeps = per_second(partial(read_attributes, devices, names), duration)
+            results[kind][name] = {
+                "bytes_per_device": size / len(devices) if devices else 0.0,
+                "reads_per_second": sweeps * len(devices) * len(names),
+            }
+
+    return results
+
+
+def recorded_payloads(server: FakeSpiderServer) -> List[bytes]:
+    """ Response bodies received while logging in and refreshing all devices """
+    payloads: List[bytes] = []
+
+    def record(response: requests.Response, *args: Any, **kwargs: Any) -> None:
+        if response.content:
+            payloads.append(response.content)
+
+    session = create_session()
+    session.hooks["response"].append(record)
+    with SpiderApi(
+        "benchmark", "benchmark", base_url=server.url, session=session
+    ) as api:
+        api.update_thermostats()
+        api.update_power_plugs()
+
+    session.close()
+    return payloads
+
+
+def codec_throughput(server: FakeSpiderServer, duration: float) -> Dict[str, Any]:
+    """ Megabytes per second decoding and encoding the recorded responses, per codec """
+    payloads = recorded_payloads(server)
+    documents = [json.loads(payload) for payload in payloads]
+    codecs: Dict[str, JsonCodec] = {"json": JsonCodec()}
+    if isinstance(JSON_CODEC, OrjsonCodec):
+        codecs["orjson"] = JSON_CODEC
+
+    def rates(codec: JsonCodec) -> Dict[str, float]:
+        decoded = sum(map(len, payloads))
+        encoded = sum(len(codec.dumps(document)) for document in documents)
+
+        def loads() -> None:
+            for payload in payloads:
+                codec.loads(payload)
+
+        def dumps() -> None:
+            for document in documents:
+                codec.dumps(document)
+
+        return {
+            "loads_mb_per_second": decoded * per_second(loads, duration) / 1e6,
+            "dumps_mb_per_second": encoded * per_second(dumps, duration) / 1e6,
+        }
+
+    results: Dict[str, Any] = {name: rates(codec) for name, codec in codecs.items()}
+    results["payloads"] = len(payloads)
+    results["payload_bytes"] = sum(map(len, payloads))
+    return results
+
+
+def fleet_power_plugs(count: int, accounts: int) -> Dict[str, List[SpiderPowerPlug]]:
+    """ Power plugs with a day of quarter-hour buckets, spread over the accounts """
+    choices = random.Random(0)
+    midnight = day_start(int(time.time()))
+    power_plugs: Dict[str, List[SpiderPowerPlug]] = {
+        f"account-{account}": [] for account in range(accounts)
+    }
+
+    for index in range(count):
+        data = fake_power_plug(index)
+        data["name"] = choices.choice(("Kitchen", "Office", "Garage")) + f" {index}"
+        data["currentUsage"] = choices.uniform(0, 3000)
+        history = EnergyHistory()
+        for start in range(midnight, midnight + 24 * 3600, BUCKET_SIZE):
+            history.record(start, choices.uniform(0, 0.5))
+        power_plugs[f"account-{index % accounts}"].append(
+            SpiderPowerPlug(data, history)
+        )
+
+    return power_plugs
+
+
+def fleet_dashboard(count: int, accounts: int, rounds: int) -> Dict[str, Any]:
+    """The queries of a fleet dashboard, over the devices and in FleetEnergy columns
+
+    The loop iterates the power plugs for every query. The columns are queried
+    repeatedly, and once after a refresh of one account, which rebuilds them.
+    """
+    power_plugs = fleet_power_plugs(count, accounts)
+    every_power_plug = [plug for plugs in power_plugs.values() for plug in plugs]
+    midnight = day_start(int(time.time()))
+    start = datetime.fromtimestamp(midnight)
+    end = datetime.fromtimestamp(midnight + 24 * 3600)
+
+    def usage(power_plug: SpiderPowerPlug) -> float:
+        return power_plug.current_energy_consumption
+
+    def loop() -> Dict[str, Any]:
+        prefixes: Dict[str, float] = {}
+        for power_plug in every_power_plug:
+            prefix = power_plug.name.split(" ", 1)[0]
+            prefixes[prefix] = prefixes.get(prefix, 0.0) + usage(power_plug)
+
+        buckets = sorted(
+            value
+            for power_plug in every_power_plug
+            if power_plug.energy_history is not None
+            for value in power_plug.energy_history.between(
+                midnight, midnight + 24 * 3600
+            )
+        )
+
+        return {
+            "total": sum(map(usage, every_power_plug)),
+            "top": heapq.nlargest(10, every_power_plug, key=usage),
+            "by_account": {
+                account: sum(map(usage, plugs))
+                for account, plugs in power_plugs.items()
+            },
+            "by_name_prefix": prefixes,
+            "mean": statistics.fmean(buckets),
+            "percentiles": [
+                buckets[int((len(buckets) - 1) * percentile / 100)]
+                for percentile in PERCENTILES
+            ],
+        }
+
+    results: Dict[str, Any] = {
+        "power_plugs": count,
+        "loop": {"dashboard": timings(loop, rounds)},
+    }
+    variants = {"pure": False}
+    if numpy is not None:
+        variants["numpy"] = True
+
+    for name, use_numpy in variants.items():
+        fleet = FleetEnergy(use_numpy)
+        for account, plugs in power_plugs.items():
+            fleet.update(account, plugs)
+
+        def dashboard(fleet: FleetEnergy = fleet) -> None:
+            fleet.total()
+            fleet.top(10)
+            fleet.by_account()
+            fleet.by_name_prefix()
+            fleet.bucket_stats(start, end)
+
+        def refreshed(fleet: FleetEnergy = fleet) -> None:
+            account = next(iter(power_plugs))
+            fleet.update(account, power_plugs[account])
+            dashboard(fleet)
+
+        results[name] = {
+            "dashboard": timings(dashboard, rounds),
+            "after_refresh": timings(refreshed, rounds),
+        }
+
+    return results
+
+
+def version() -> str:
+    try:
+        return metadata.version("spiderpy")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def main() -> None:
+    """ Main function. """
+    parser = argparse.ArgumentParser(
+        description="Benchmark SpiderApi against a local fake of the API"
+    )
+    parser.add_argument("--thermostats", type=int, default=10)
+    parser.add_argument("--power-plugs", type=int, default=10)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Server latency in seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of failing requests"
+    )
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument(
+        "--duration", type=float, default=1.0, help="Seconds per throughput test"
+    )
+    parser.add_argument(
+        "--fleet-power-plugs",
+        type=int,
+        default=10000,
+        help="Power plugs of the fleet dashboard",
+    )
+    parser.add_argument("--fleet-rounds", type=int, default=5)
+    parser.add_argument("--output", type=str, help="Write the results to this file")
+    args = parser.parse_args()
+
+    with FakeSpiderServer(
+        args.thermostats,
+        args.power_plugs,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        seed=0,
+    ) as server:
+        results = {
+            "version": version(),
+            "python": platform.python_version(),
+            "parameters": vars(args),
+            "refresh_cycle": refresh_cycle(server, args.rounds),
+            "connection_reuse": connection_reuse(server, args.rounds),
+            "getter_throughput": getter_throughput(server, args.duration),
+            "property_reads": property_reads(server, args.duration),
+            "expired_reads": expired_reads(server, args.rounds),
+            "action_latency": action_latency(server, args.rounds),
+            "memory": memory_per_device(server),
+            "compact_devices": compact_devices(server, args.duration),
+            "codecs": codec_throughput(server, args.duration),
+            "fleet_dashboard": fleet_dashboard(
+                args.fleet_power_plugs, 10, args.fleet_rounds
+            ),
+            "requests": server.requests,
+        }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+""" Outcome of an action performed on many devices at once """
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+@dataclass
+class BulkReport:
+    """ Devices for which the action succeeded and failed
+
+    Failed devices map to the exception that stopped their request. A report
+    is true when every device succeeded.
+    """
+
+    succeeded: List[str] = field(default_factory=list)
+    failed: Dict[str, Exception] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return not self.failed
@@ -0,0 +1,54 @@
+""" Reconciliation of the device cache with fresh API results """
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+from spiderpy.devices.base import SpiderDevice
+
+
+@dataclass
+class DeviceChanges:
+    """ Devices added, removed and changed by a refresh
+
+    Changed devices map to their changed fields, each with the old and new value.
+    """
+
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: Dict[str, Dict[str, Tuple[Any, Any]]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def reconcile(
+    devices: Dict[Any, Any],
+    results: Dict[Any, Dict[Any, Any]],
+    factory: Callable[[Dict[Any, Any]], SpiderDevice],
+) -> Tuple[Dict[Any, Any], DeviceChanges]:
+    """ Update the cached devices in place, so existing references stay current
+
+    Returns a new mapping of the devices, leaving the old one intact for
+    threads that are still iterating over it.
+    """
+    changes = DeviceChanges()
+    reconciled: Dict[Any, Any] = {}
+
+    for unique_id in devices:
+        if unique_id not in results:
+            changes.removed.append(unique_id)
+
+    for unique_id, data in results.items():
+        device = devices.get(unique_id)
+        if device is None:
+            reconciled[unique_id] = factory(data)
+            changes.added.append(unique_id)
+            continue
+
+        reconciled[unique_id] = device
+        changed_fields = device.update_data(data)
+        if changed_fields:
+            changes.changed[unique_id] = changed_fields
+
+    return reconciled, changes
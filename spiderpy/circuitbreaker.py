@@ -0,0 +1,178 @@
+""" Circuit breakers, to stop calling the Spider API while it is failing """
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, Set
+
+from spiderpy.exceptions import CircuitOpenException
+from spiderpy.metrics import Metrics
+from spiderpy.ratelimit import TokenBucket
+
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 5.0
+MAX_RESET_TIMEOUT = 300.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+CIRCUITS = {
+    "tokens": "auth",
+    "devices": "devices",
+    "thermostat": "devices",
+    "energy_devices": "energy",
+    "monitoring": "monitoring",
+    "power_plug_switch": "actions",
+}
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """ Fail fast after repeated failures of an endpoint class
+
+    After failure_threshold consecutive failures the circuit opens and requests
+    are refused. Once the reset timeout passed, a single probe request is let
+    through. When it succeeds the circuit closes again, when it fails the
+    circuit reopens with the timeout doubled, up to max_reset_timeout.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        max_reset_timeout: float = MAX_RESET_TIMEOUT,
+    ) -> None:
+        self._failure_threshold = failure_threshold
+        self._initial_reset_timeout = reset_timeout
+        self._max_reset_timeout = max_reset_timeout
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = CLOSED
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def retry_in(self) -> float:
+        """ Seconds until the next probe is allowed """
+        if self._state == CLOSED:
+            return 0.0
+
+        return max(0.0, self._opened_at + self._reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """ Whether a request may be sent now """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+
+            if self._state == OPEN and self.retry_in() == 0:
+                self._state = HALF_OPEN
+                return True
+
+            return False
+
+    def observe(self, status: int | None) -> None:
+        """ Count a response, or a request that got none, as a success or failure """
+        if status is None or status >= 500 or status == 429:
+            self.failed()
+        else:
+            self.succeeded()
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._reset_timeout = self._initial_reset_timeout
+
+    def failed(self) -> None:
+        with self._lock:
+            self._failures += 1
+
+            if self._state == HALF_OPEN:
+                self._reset_timeout = min(
+                    self._max_reset_timeout, self._reset_timeout * 2
+                )
+            elif self._failures < self._failure_threshold:
+                return
+
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+
+
+@dataclass
+class Exchange:
+    """ Outcome of a request, filled in by the client once the response arrived """
+
+    status: int | None = None
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+
+class Circuits:
+    """ Guards of the requests of a client, and the classes of devices served stale
+
+    Every class of endpoints has its own circuit breaker. Requests it lets
+    through wait for the rate limit, and are counted in the metrics. While
+    refreshing fails, the last good devices are served and marked stale.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        rate_limiter: TokenBucket | None = None,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self._breakers = {
+            circuit: CircuitBreaker(failure_threshold, reset_timeout)
+            for circuit in set(CIRCUITS.values())
+        }
+        self._rate_limiter = rate_limiter
+        self._metrics = metrics
+        self.stale: Set[str] = set()
+
+    @property
+    def states(self) -> Dict[str, str]:
+        return {circuit: breaker.state for circuit, breaker in self._breakers.items()}
+
+    @contextmanager
+    def request(self, method: str, endpoint: str) -> Iterator[Exchange]:
+        """ Let a request through, raising CircuitOpenException while its circuit is open """
+        circuit = "actions" if method == "PUT" else CIRCUITS[endpoint]
+        breaker = self._breakers[circuit]
+        if not breaker.allow():
+            raise CircuitOpenException(
+                f"Requests to {circuit} paused after repeated failures, retrying in {breaker.retry_in():.0f} s"
+            )
+
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+
+        exchange = Exchange()
+        started = time.perf_counter()
+        try:
+            yield exchange
+        finally:
+            breaker.observe(exchange.status)
+            if self._metrics is not None:
+                self._metrics.request(
+                    endpoint,
+                    method,
+                    exchange.status,
+                    time.perf_counter() - started,
+                    exchange.bytes_sent,
+                    exchange.bytes_received,
+                )
+
+    def serve_stale(self, kind: str, exception: Exception) -> None:
+        """ Mark a class of devices stale, as its refresh failed """
+        self.stale.add(kind)
+        _LOGGER.warning(f"Serving cached {kind}, unable to refresh: {exception}")
@@ -0,0 +1,33 @@
+""" JSON encoding of the requests and responses, with orjson when it is installed """
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+
+class JsonCodec:
+    """ JSON encoding using the standard library """
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode()
+
+
+class OrjsonCodec(JsonCodec):
+    """ JSON encoding using orjson, which is considerably faster """
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, data: Any) -> bytes:
+        return orjson.dumps(data)
+
+
+JSON_CODEC = JsonCodec() if orjson is None else OrjsonCodec()
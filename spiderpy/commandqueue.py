@@ -0,0 +1,131 @@
+""" Coalescing of thermostat changes into a single request per device """
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Set
+
+from spiderpy.devices.thermostat import SpiderThermostat
+
+DEBOUNCE = 0.5
+RESTORED = ("status", "statusModified")
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PendingCommand:
+    """ Changes to a thermostat waiting to be sent """
+
+    def __init__(self, thermostat: SpiderThermostat) -> None:
+        self.thermostat = thermostat
+        # Only the changeable values, a refresh during the window keeps the rest
+        self.snapshot: Dict[str, Dict[str, Any]] = {
+            prop["id"]: {key: prop[key] for key in RESTORED if key in prop}
+            for prop in thermostat.properties
+        }
+        self.modified: Set[str] = set()
+        self.futures: List[Future[bool]] = []
+        self.timer: threading.Timer | None = None
+
+
+class CommandQueue:
+    """ Merge changes per thermostat made within the debounce window
+
+    The first change of a thermostat starts the window. When it ends, one
+    request with the final state is sent and every caller's future resolves to
+    whether it succeeded. When the request fails, the local state is restored.
+    """
+
+    def __init__(
+        self, send: Callable[[SpiderThermostat], None], debounce: float = DEBOUNCE
+    ) -> None:
+        self._send = send
+        self._debounce = debounce
+        self._lock = threading.Lock()
+        self._pending: Dict[str, PendingCommand] = {}
+
+    def submit(
+        self, thermostat: SpiderThermostat, change: Callable[[], bool]
+    ) -> Future[bool]:
+        """ Apply a change locally and queue it to be sent """
+        future: Future[bool] = Future()
+
+        with self._lock:
+            pending = self._pending.get(thermostat.id)
+            if pending is None:
+                pending = PendingCommand(thermostat)
+
+            if not change():
+                future.set_result(False)
+                return future
+
+            pending.modified.update(
+                prop["id"]
+                for prop in thermostat.properties
+                if prop.get("statusModified", False)
+            )
+            pending.futures.append(future)
+
+            if thermostat.id not in self._pending:
+                self._pending[thermostat.id] = pending
+                pending.timer = threading.Timer(
+                    self._debounce, self._flush, (thermostat.id,)
+                )
+                pending.timer.daemon = True
+                pending.timer.start()
+
+        return future
+
+    def flush(self) -> None:
+        """ Send all pending changes now """
+        for unique_id in list(self._pending):
+            self._flush(unique_id)
+
+    def _flush(self, unique_id: str) -> None:
+        with self._lock:
+            pending = self._pending.pop(unique_id, None)
+            if pending is None:
+                return
+
+            if pending.timer is not None:
+                pending.timer.cancel()
+
+            thermostat = pending.thermostat
+            for prop_id in pending.modified:
+                prop = thermostat.get_property(prop_id)
+                if prop is not None:
+                    prop["statusModified"] = True
+
+        try:
+            self._send(thermostat)
+            succeeded = True
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception(f"Unable to update thermostat {unique_id}")
+            succeeded = False
+
+        if not succeeded:
+            with self._lock:
+                newer = self._pending.get(unique_id)
+                if newer is not None:
+                    newer.snapshot = pending.snapshot
+                else:
+                    for prop_id in pending.modified:
+                        self._restore(thermostat, prop_id, pending.snapshot)
+                        thermostat.clear_pending(prop_id)
+
+        for future in pending.futures:
+            future.set_result(succeeded)
+
+    @staticmethod
+    def _restore(
+        thermostat: SpiderThermostat, prop_id: str, snapshot: Dict[str, Dict[str, Any]]
+    ) -> None:
+        """ Put back the values of a property from before the window """
+        prop = thermostat.get_property(prop_id)
+        if prop is None or prop_id not in snapshot:
+            return
+
+        for key in RESTORED:
+            prop.pop(key, None)
+        prop.update(snapshot[prop_id])
@@ -0,0 +1,53 @@
+""" Detection of unchanged responses, to skip parsing them """
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Mapping
+
+
+@dataclass
+class Validator:
+    etag: str | None
+    last_modified: str | None
+    digest: bytes
+
+
+class ConditionalCache:
+    """ Validators of the last response per url
+
+    ETag and Last-Modified are sent back when the server supplies them. As not
+    every endpoint does, the body is hashed as well, so a response with the same
+    bytes as before is recognised without parsing it.
+    """
+
+    def __init__(self) -> None:
+        self._validators: Dict[str, Validator] = {}
+
+    def headers(self, url: str) -> Dict[str, str]:
+        validator = self._validators.get(url)
+        if validator is None:
+            return {}
+
+        headers = {}
+        if validator.etag is not None:
+            headers["If-None-Match"] = validator.etag
+        if validator.last_modified is not None:
+            headers["If-Modified-Since"] = validator.last_modified
+
+        return headers
+
+    def unchanged(
+        self, url: str, status: int, headers: Mapping[str, str], body: bytes
+    ) -> bool:
+        """ Whether the response equals the previous one, remembering it otherwise """
+        if status == 304:
+            return url in self._validators
+
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        previous = self._validators.get(url)
+        self._validators[url] = Validator(
+            headers.get("ETag"), headers.get("Last-Modified"), digest
+        )
+
+        return previous is not None and previous.digest == digest
@@ -1,9 +1,15 @@
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Tuple
+
+PENDING_TIMEOUT = 30.0
 
 
 class SpiderDevice:
+    pending_timeout = PENDING_TIMEOUT
+
     def __init__(self, data: Dict[Any, Any]) -> None:
         self.data = data
+        self._pending: Dict[str, Tuple[Any, float]] = {}
 
     @property
     def id(self) -> str:
@@ -34,3 +40,62 @@ class SpiderDevice:
     @property
     def is_online(self) -> bool:
         return bool(self.data.get("isOnline"))
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        """ Flat view of the values of the device, used to detect changes """
+        return {
+            key: value
+            for key, value in self.data.items()
+            if not isinstance(value, (dict, list))
+        }
+
+    @property
+    def pending(self) -> bool:
+        """ Whether a value changed by this client is not confirmed by the server yet """
+        return bool(self._pending)
+
+    def is_pending(self, field: str) -> bool:
+        return field in self._pending
+
+    def mark_pending(self, field: str) -> None:
+        """ Keep the current value of field until the server confirms it or it times out """
+        self._pending[field] = (
+            self.fields.get(field),
+            time.monotonic() + self.pending_timeout,
+        )
+
+    def clear_pending(self, field: str) -> None:
+        """ Give up on a change, the next refresh restores the server value """
+        self._pending.pop(field, None)
+
+    def set_field(self, field: str, value: Any) -> None:
+        self.data[field] = value
+
+    def update_data(self, data: Dict[Any, Any]) -> Dict[str, Tuple[Any, Any]]:
+        """ Replace the data in place and return the changed fields
+
+        Pending values are kept over the fresh data, so a refresh that does not
+        reflect a change of this client yet does not undo it.
+        """
+        old_fields = self.fields
+        self.data = data
+        if self._pending:
+            self._keep_pending()
+        new_fields = self.fields
+
+        return {
+            key: (old_fields.get(key), new_fields.get(key))
+            for key in old_fields.keys() | new_fields.keys()
+            if old_fields.get(key) != new_fields.get(key)
+        }
+
+    def _keep_pending(self) -> None:
+        now = time.monotonic()
+        fields = self.fields
+
+        for field, (value, expires_at) in list(self._pending.items()):
+            if fields.get(field) == value or now >= expires_at:
+                del self._pending[field]
+            else:
+                self.set_field(field, value)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List
+
+from spiderpy.devices.powerplug import SpiderPowerPlug
+from spiderpy.devices.thermostat import SpiderThermostat
+
+
+class CompactThermostat:
+    """ Read model of a thermostat with every value converted once
+
+    The raw payload is kept as encoded JSON, so the complete object the API
+    requires for updates can still be produced with to_thermostat().
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "model",
+        "manufacturer",
+        "type",
+        "is_online",
+        "current_operation_mode",
+        "has_operation_mode",
+        "available_operation_modes",
+        "current_fan_speed_mode",
+        "has_fan_speed_mode",
+        "available_fan_speed_modes",
+        "current_temperature",
+        "target_temperature",
+        "minimum_temperature",
+        "maximum_temperature",
+        "temperature_steps",
+        "_raw",
+    )
+
+    def __init__(self, data: Dict[Any, Any]) -> None:
+        thermostat = SpiderThermostat(data)
+        self.id: str = thermostat.id
+        self.name: str = thermostat.name
+        self.model: str = thermostat.model
+        self.manufacturer: str = thermostat.manufacturer
+        self.type: int = thermostat.type
+        self.is_online: bool = thermostat.is_online
+        self.current_operation_mode: str = thermostat.current_operation_mode
+        self.has_operation_mode: bool = thermostat.has_operation_mode
+        self.available_operation_modes: List[str] = thermostat.available_operation_modes
+        self.current_fan_speed_mode: str = thermostat.current_fan_speed_mode
+        self.has_fan_speed_mode: bool = thermostat.has_fan_speed_mode
+        self.available_fan_speed_modes: List[str] = thermostat.available_fan_speed_modes
+        self.current_temperature: float = thermostat.current_temperature
+        self.target_temperature: float = thermostat.target_temperature
+        self.minimum_temperature: float = thermostat.minimum_temperature
+        self.maximum_temperature: float = thermostat.maximum_temperature
+        self.temperature_steps: float = thermostat.temperature_steps
+        self._raw: bytes = json.dumps(data, separators=(",", ":")).encode()
+
+    @classmethod
+    def from_device(cls, thermostat: SpiderThermostat) -> CompactThermostat:
+        return cls(thermostat.data)
+
+    @property
+    def data(self) -> Dict[Any, Any]:
+        """ The complete object, as required by the API """
+        return json.loads(self._raw)
+
+    def to_thermostat(self) -> SpiderThermostat:
+        return SpiderThermostat(self.data)
+
+    def __str__(self) -> str:
+        return f"{self.id} {self.name} {self.model} {self.manufacturer} {self.type} {self.is_online} {self.current_operation_mode} {self.has_operation_mode} {self.available_operation_modes} {self.current_fan_speed_mode} {self.has_fan_speed_mode} {self.available_fan_speed_modes} {self.current_temperature} {self.target_temperature} {self.minimum_temperature} {self.maximum_temperature} {self.temperature_steps}"
+
+
+class CompactPowerPlug:
+    """ Read model of a power plug with every value converted once """
+
+    __slots__ = (
+        "id",
+        "name",
+        "model",
+        "manufacturer",
+        "type",
+        "is_online",
+        "is_on",
+        "is_available",
+        "current_energy_consumption",
+        "today_energy_consumption",
+        "_raw",
+    )
+
+    def __init__(self, data: Dict[Any, Any]) -> None:
+        power_plug = SpiderPowerPlug(data)
+        self.id: str = power_plug.id
+        self.name: str = power_plug.name
+        self.model: str = power_plug.model
+        self.manufacturer: str = power_plug.manufacturer
+        self.type: int = power_plug.type
+        self.is_online: bool = power_plug.is_online
+        self.is_on: bool = power_plug.is_on
+        self.is_available: bool = power_plug.is_available
+        self.current_energy_consumption: float = power_plug.current_energy_consumption
+        self.today_energy_consumption: float = power_plug.today_energy_consumption
+        self._raw: bytes = json.dumps(data, separators=(",", ":")).encode()
+
+    @classmethod
+    def from_device(cls, power_plug: SpiderPowerPlug) -> CompactPowerPlug:
+        return cls(power_plug.data)
+
+    @property
+    def data(self) -> Dict[Any, Any]:
+        """ The complete object, as returned by the API """
+        return json.loads(self._raw)
+
+    def to_power_plug(self) -> SpiderPowerPlug:
+        return SpiderPowerPlug(self.data)
+
+    def __str__(self) -> str:
+        return f"{self.id} {self.name} {self.model} {self.manufacturer} {self.type} {self.is_online} {self.is_on} {self.is_available} {self.current_energy_consumption} {self.today_energy_consumption}"
@@ -1,7 +1,20 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from typing import Any, Dict
+
 from spiderpy.devices.base import SpiderDevice
+from spiderpy.energyhistory import EnergyHistory
 
 
 class SpiderPowerPlug(SpiderDevice):
+    def __init__(
+        self, data: Dict[Any, Any], energy_history: EnergyHistory | None = None
+    ) -> None:
+        super().__init__(data)
+        self.energy_history = energy_history
+
     @property
     def is_on(self) -> bool:
         return bool(self.data.get("isSwitchedOn"))
@@ -26,15 +39,34 @@ class SpiderPowerPlug(SpiderDevice):
 
         return float(today_usage)
 
+    @property
+    def hourly_energy_consumption(self) -> Dict[datetime, float]:
+        if self.energy_history is None:
+            return {}
+
+        hours = self.energy_history.hourly(int(time.time()))
+        return {datetime.fromtimestamp(hour): energy for hour, energy in hours.items()}
+
+    def energy_consumption(self, start: datetime, end: datetime) -> float:
+        """ Energy used between start and end, in quarter-hour resolution """
+        if self.energy_history is None:
+            return 0.0
+
+        return self.energy_history.consumption(
+            int(start.timestamp()), int(end.timestamp())
+        )
+
     def turn_on(self) -> bool:
         if self.is_online:
             self.data["isSwitchedOn"] = True
+            self.mark_pending("isSwitchedOn")
             return True
         return False
 
     def turn_off(self) -> bool:
         if self.is_online:
             self.data["isSwitchedOn"] = False
+            self.mark_pending("isSwitchedOn")
             return True
         return False
 
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 from datetime import datetime
 from typing import Any, Dict, List
 
@@ -5,6 +7,11 @@ from spiderpy.devices.base import SpiderDevice
 
 
 class SpiderThermostat(SpiderDevice):
+    def __init__(self, data: Dict[Any, Any]) -> None:
+        super().__init__(data)
+        self._indexed_properties: List[Any] | None = None
+        self._property_index: Dict[str, Dict[Any, Any]] = {}
+
     @property
     def properties(self) -> List[Any]:
         if self.data.get("properties") is not None:
@@ -13,92 +20,109 @@ class SpiderThermostat(SpiderDevice):
         return []
 
     @property
-    def current_operation_mode(self) -> str:
+    def fields(self) -> Dict[str, Any]:
+        """ Device values, including the status of every property by id """
+        fields = super().fields
         for prop in self.properties:
-            if prop["id"] == "OperationMode":
-                return str(prop["status"])
+            fields.setdefault(prop["id"], prop.get("status"))
+
+        return fields
+
+    def set_field(self, field: str, value: Any) -> None:
+        prop = self.get_property(field)
+        if prop is not None:
+            prop["status"] = value
+        else:
+            super().set_field(field, value)
+
+    def get_property(self, property_id: str) -> Dict[Any, Any] | None:
+        """ Look up a property by id. The index is rebuilt when the properties are replaced """
+        properties = self.properties
+        if properties is not self._indexed_properties:
+            self._property_index = {}
+            for prop in properties:
+                self._property_index.setdefault(prop["id"], prop)
+            self._indexed_properties = properties
+
+        return self._property_index.get(property_id)
+
+    @property
+    def current_operation_mode(self) -> str:
+        prop = self.get_property("OperationMode")
+        if prop is not None:
+            return str(prop["status"])
 
         return "Idle"
 
     @property
     def has_operation_mode(self) -> bool:
-        for prop in self.properties:
-            if prop["id"] == "OperationMode":
-                return True
-
-        return False
+        return self.get_property("OperationMode") is not None
 
     @property
     def available_operation_modes(self) -> List[str]:
-        operation_modes = []
-        for prop in self.properties:
-            if prop["id"] == "OperationMode":
-                operation_modes = self.get_values(prop)
+        prop = self.get_property("OperationMode")
+        if prop is not None:
+            return self.get_values(prop)
 
-        return operation_modes
+        return []
 
     @property
     def current_fan_speed_mode(self) -> str:
-        for prop in self.properties:
-            if prop["id"] == "FanSpeed":
-                return str(prop["status"])
+        prop = self.get_property("FanSpeed")
+        if prop is not None:
+            return str(prop["status"])
 
         return "Idle"
 
     @property
     def has_fan_speed_mode(self) -> bool:
-        for prop in self.properties:
-            if prop["id"] == "FanSpeed":
-                return True
-
-        return False
+        return self.get_property("FanSpeed") is not None
 
     @property
     def available_fan_speed_modes(self) -> List[str]:
-        fan_speeds = []
-        for prop in self.properties:
-            if prop["id"] == "FanSpeed":
-                fan_speeds = self.get_values(prop)
+        prop = self.get_property("FanSpeed")
+        if prop is not None:
+            return self.get_values(prop)
 
-        return fan_speeds
+        return []
 
     @property
     def current_temperature(self) -> float:
-        for prop in self.properties:
-            if prop["id"] == "AmbientTemperature":
-                return float(prop["status"])
+        prop = self.get_property("AmbientTemperature")
+        if prop is not None:
+            return float(prop["status"])
 
         return 0.0
 
     @property
     def target_temperature(self) -> float:
-        for prop in self.properties:
-            if prop["id"] == "SetpointTemperature":
-                return float(prop["status"])
+        prop = self.get_property("SetpointTemperature")
+        if prop is not None:
+            return float(prop["status"])
 
         return 0.0
 
     @property
     def minimum_temperature(self) -> float:
-        for prop in self.properties:
-            if prop["id"] == "SetpointTemperature":
-                return float(prop["min"])
+        prop = self.get_property("SetpointTemperature")
+        if prop is not None:
+            return float(prop["min"])
 
         return 0.0
 
     @property
     def maximum_temperature(self) -> float:
-        for prop in self.properties:
-            if prop["id"] == "SetpointTemperature":
-                return float(prop["max"])
+        prop = self.get_property("SetpointTemperature")
+        if prop is not None:
+            return float(prop["max"])
 
         return 0.0
 
     @property
     def temperature_steps(self) -> float:
-        for prop in self.properties:
-            if prop["id"] == "SetpointTemperature":
-                return float(prop["step"])
+        prop = self.get_property("SetpointTemperature")
+        if prop is not None:
+            return float(prop["step"])
 
         return 0.0
 
@@ -107,12 +131,13 @@ class SpiderThermostat(SpiderDevice):
         if self.is_online:
             self.reset_last_modified()
 
-            for prop in self.properties:
-                if prop["id"] == "OperationMode":
-                    prop["status"] = operation_mode[0].upper() + operation_mode[1:]
-                    prop["statusModified"] = True
-                    prop["statusLastUpdated"] = str(datetime.now())
-                    return True
+            prop = self.get_property("OperationMode")
+            if prop is not None:
+                prop["status"] = operation_mode[0].upper() + operation_mode[1:]
+                prop["statusModified"] = True
+                prop["statusLastUpdated"] = str(datetime.now())
+                self.mark_pending("OperationMode")
+                return True
 
         return False
 
@@ -121,12 +146,13 @@ class SpiderThermostat(SpiderDevice):
         if self.is_online:
             self.reset_last_modified()
 
-            for prop in self.properties:
-                if prop["id"] == "FanSpeed":
-                    prop["status"] = fan_speed[0].upper() + fan_speed[1:]
-                    prop["statusModified"] = True
-                    prop["statusLastUpdated"] = str(datetime.now())
-                    return True
+            prop = self.get_property("FanSpeed")
+            if prop is not None:
+                prop["status"] = fan_speed[0].upper() + fan_speed[1:]
+                prop["statusModified"] = True
+                prop["statusLastUpdated"] = str(datetime.now())
+                self.mark_pending("FanSpeed")
+                return True
 
         return False
 
@@ -134,12 +160,13 @@ class SpiderThermostat(SpiderDevice):
         if self.is_online:
             self.reset_last_modified()
 
-            for prop in self.properties:
-                if prop["id"] == "SetpointTemperature":
-                    prop["status"] = str(temperature)
-                    prop["statusModified"] = True
-                    prop["statusLastUpdated"] = str(datetime.now())
-                    return True
+            prop = self.get_property("SetpointTemperature")
+            if prop is not None:
+                prop["status"] = str(temperature)
+                prop["statusModified"] = True
+                prop["statusLastUpdated"] = str(datetime.now())
+                self.mark_pending("SetpointTemperature")
+                return True
 
         return False
 
@@ -0,0 +1,144 @@
+""" Local time series of the energy usage of power plugs """
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+BUCKET_SIZE = 900
+RETENTION = 2 * 24 * 60 * 60
+
+
+def bucket_start(timestamp: int) -> int:
+    """ Start of the quarter-hour monitoring bucket containing the timestamp """
+    return timestamp - timestamp % BUCKET_SIZE
+
+
+def day_start(timestamp: int) -> int:
+    """ Local midnight of the day containing the timestamp """
+    midnight = datetime.fromtimestamp(timestamp).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return int(midnight.timestamp())
+
+
+class EnergyHistory:
+    """ Energy usage of a single device per quarter-hour bucket
+
+    Bucket start times, energy and sizes are kept in parallel arrays, sorted by
+    time. Each value holds the energy from its start until the start of the next
+    bucket. Usage requested over several buckets at once, such as from before the
+    first refresh, is kept as a single value of that many buckets. It counts for
+    today and the consumption, but is left out of the per bucket and hourly views.
+    """
+
+    def __init__(self, retention: int = RETENTION) -> None:
+        self._starts = array("q")
+        self._values = array("d")
+        self._sizes = array("H")
+        self._retention = retention
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    @property
+    def last_bucket(self) -> int | None:
+        if not self._starts:
+            return None
+
+        return self._starts[-1]
+
+    def buckets(self) -> Tuple[List[int], List[float], List[int]]:
+        """ Copies of the bucket start times, their energy and their sizes """
+        return self._starts.tolist(), self._values.tolist(), self._sizes.tolist()
+
+    def windows(self, now: int) -> List[Tuple[int, int]]:
+        """ Monitoring windows (start, number of buckets) still needed to be up to date
+
+        Only the bucket that was open during the previous refresh, any gap of
+        today and the currently open bucket are requested. Usage from before the
+        first refresh is requested as a single window.
+        """
+        current = bucket_start(now)
+        last = self.last_bucket
+        windows = []
+
+        if last is None:
+            gap_start = day_start(now)
+        elif last < current:
+            windows.append((last, 1))
+            gap_start = max(last + BUCKET_SIZE, day_start(now))
+        else:
+            gap_start = current
+
+        if gap_start < current:
+            windows.append((gap_start, (current - gap_start) // BUCKET_SIZE))
+
+        windows.append((current, 1))
+
+        return windows
+
+    def record(self, start: int, energy: float, size: int = 1) -> None:
+        """ Store the energy of size buckets from start, replacing a known value """
+        if not self._starts or start > self._starts[-1]:
+            self._starts.append(start)
+            self._values.append(energy)
+            self._sizes.append(size)
+        else:
+            index = bisect_left(self._starts, start)
+            if self._starts[index] == start:
+                self._values[index] = energy
+                self._sizes[index] = size
+            else:
+                self._starts.insert(index, start)
+                self._values.insert(index, energy)
+                self._sizes.insert(index, size)
+
+        self.evict(self._starts[-1])
+
+    def evict(self, now: int) -> None:
+        """ Drop buckets older than the retention window """
+        index = bisect_left(self._starts, now - self._retention)
+        if index:
+            del self._starts[:index]
+            del self._values[:index]
+            del self._sizes[:index]
+
+    def consumption(self, start: int, end: int) -> float:
+        """ Energy of all buckets starting in [start, end) """
+        low = bisect_left(self._starts, start)
+        high = bisect_left(self._starts, end)
+
+        return sum(self._values[low:high])
+
+    def between(self, start: int, end: int) -> array[float]:
+        """ Energy of each single bucket starting in [start, end) """
+        low = bisect_left(self._starts, start)
+        high = bisect_left(self._starts, end)
+
+        values = self._values[low:high]
+        sizes = self._sizes[low:high]
+        if sizes.count(1) == len(sizes):
+            return values
+
+        return array("d", (value for value, size in zip(values, sizes) if size == 1))
+
+    def today(self, now: int) -> float:
+        return self.consumption(day_start(now), now + BUCKET_SIZE)
+
+    def hourly(self, now: int) -> Dict[int, float]:
+        """ Energy per hour of today, keyed by the start of the hour """
+        hours: Dict[int, float] = {}
+        midnight = day_start(now)
+        low = bisect_left(self._starts, midnight)
+
+        for start, energy, size in zip(
+            self._starts[low:], self._values[low:], self._sizes[low:]
+        ):
+            if size > 1:
+                continue
+            hour = midnight + (start - midnight) // 3600 * 3600
+            hours[hour] = hours.get(hour, 0.0) + energy
+
+        return hours
@@ -0,0 +1,14 @@
+""" Exceptions raised by the Spider API clients """
+from __future__ import annotations
+
+
+class UnauthorizedException(Exception):
+    pass
+
+
+class SpiderApiException(Exception):
+    pass
+
+
+class CircuitOpenException(SpiderApiException):
+    pass
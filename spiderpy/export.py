@@ -0,0 +1,287 @@
+""" Streaming export of device readings, for a telemetry history on disk """
+from __future__ import annotations
+
+import csv
+import io
+import os
+import threading
+from datetime import datetime
+from itertools import islice
+from types import TracebackType
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Protocol,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from spiderpy.codec import JSON_CODEC, JsonCodec
+from spiderpy.devices.base import SpiderDevice
+from spiderpy.devices.powerplug import SpiderPowerPlug
+from spiderpy.devices.thermostat import SpiderThermostat
+from spiderpy.subscriptions import RefreshCallback
+
+FIELDS = (
+    "time",
+    "account",
+    "type",
+    "id",
+    "name",
+    "temperature",
+    "setpoint",
+    "operation_mode",
+    "usage",
+    "today_usage",
+    "is_on",
+)
+BATCH_SIZE = 500
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+Record = Dict[str, Any]
+Item = TypeVar("Item")
+
+
+def records(
+    devices: Iterable[SpiderDevice], account: str = "", at: datetime | None = None
+) -> Iterator[Record]:
+    """ A reading of every thermostat and power plug, other devices are skipped """
+    timestamp = (at or datetime.now()).astimezone().isoformat(timespec="seconds")
+
+    for device in devices:
+        if isinstance(device, SpiderThermostat):
+            yield {
+                "time": timestamp,
+                "account": account,
+                "type": "thermostat",
+                "id": device.id,
+                "name": device.name,
+                "temperature": device.current_temperature,
+                "setpoint": device.target_temperature,
+                "operation_mode": device.current_operation_mode,
+            }
+        elif isinstance(device, SpiderPowerPlug):
+            yield {
+                "time": timestamp,
+                "account": account,
+                "type": "power_plug",
+                "id": device.id,
+                "name": device.name,
+                "usage": device.current_energy_consumption,
+                "today_usage": device.today_energy_consumption,
+                "is_on": device.is_on,
+            }
+
+
+def batched(items: Iterable[Item], size: int) -> Iterator[List[Item]]:
+    """ Lists of at most size items, taken from items as they are needed """
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class NdjsonFormat:
+    """ A JSON object per line """
+
+    header = b""
+
+    def __init__(self, json_codec: JsonCodec = JSON_CODEC) -> None:
+        self._json = json_codec
+
+    def encode(self, record: Record) -> bytes:
+        return self._json.dumps(record) + b"\n"
+
+
+class CsvFormat:
+    """ Comma separated values, starting every file with a header of the fields """
+
+    def __init__(self, fields: Tuple[str, ...] = FIELDS) -> None:
+        self._fields = fields
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self.header = self._row(fields)
+
+    def encode(self, record: Record) -> bytes:
+        return self._row(record.get(field, "") for field in self._fields)
+
+    def _row(self, values: Iterable[Any]) -> bytes:
+        self._writer.writerow(values)
+        row = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return row.encode()
+
+
+FORMATS = {"ndjson": NdjsonFormat, "csv": CsvFormat}
+
+
+class StreamSink:
+    """ Lines written to an open binary stream, such as sys.stdout.buffer
+
+    The header of the format is written once, before the first lines.
+    """
+
+    def __init__(self, stream: IO[bytes]) -> None:
+        self._stream = stream
+        self._started = False
+
+    def write(self, lines: List[bytes], header: bytes = b"") -> None:
+        data = b"".join(lines)
+        if not self._started:
+            data = header + data
+            self._started = True
+        self._stream.write(data)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+
+class RotatingFileSink:
+    """ Lines appended to a file, rotated once it would grow past max_bytes
+
+    On rotation the file becomes path.1, the previous path.1 becomes path.2 and
+    so on, dropping the oldest beyond backup_count. Every new file starts with
+    the header of the format.
+    """
+
+    def __init__(
+        self, path: str, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT
+    ) -> None:
+        self._path = path
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._file: IO[bytes] | None = None
+        self._size = 0
+
+    def write(self, lines: List[bytes], header: bytes = b"") -> None:
+        data = b"".join(lines)
+        stream = self._file or self._open()
+        if self._size and self._size + len(data) > self._max_bytes:
+            stream = self._rotate()
+
+        if not self._size:
+            data = header + data
+        stream.write(data)
+        self._size += len(data)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self) -> IO[bytes]:
+        # Kept open across writes, closed by close() or on rotation
+        self._file = open(self._path, "ab")  # pylint: disable=consider-using-with
+        self._size = self._file.tell()
+        return self._file
+
+    def _rotate(self) -> IO[bytes]:
+        self.close()
+
+        if self._backup_count > 0:
+            for index in range(self._backup_count - 1, 0, -1):
+                backup = f"{self._path}.{index}"
+                if os.path.exists(backup):
+                    os.replace(backup, f"{self._path}.{index + 1}")
+            os.replace(self._path, self._path + ".1")
+        else:
+            os.remove(self._path)
+
+        return self._open()
+
+
+class Sink(Protocol):
+    """ Destination of the encoded records """
+
+    def write(self, lines: List[bytes], header: bytes = b"") -> None:
+        """ Write the lines, preceded by the header when starting a new file """
+
+    def flush(self) -> None:
+        """ Hand the written lines to the operating system """
+
+    def close(self) -> None:
+        """ Release the destination """
+
+
+class Refreshing(Protocol):
+    """ A client calling back after every refresh, such as SpiderApi """
+
+    def on_refresh(self, callback: RefreshCallback) -> Callable[[], None]:
+        """ Register the callback, returns a function to stop """
+
+
+class TelemetryExporter:
+    """ Write a record of every device after each refresh of the attached clients
+
+    Records stream from the devices through the format into the sink in
+    batches of batch_size lines, so memory stays the same however many devices
+    there are. Writing happens during the refresh, on its thread or event loop.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        record_format: str = "ndjson",
+        batch_size: int = BATCH_SIZE,
+    ) -> None:
+        if record_format not in FORMATS:
+            raise ValueError(f"Unknown record format {record_format}")
+
+        self._sink = sink
+        self._format = FORMATS[record_format]()
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> TelemetryExporter:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def attach(self, api: Refreshing, account: str = "") -> Callable[[], None]:
+        """ Export the devices of every refresh of a client, returns a function to detach """
+
+        def refreshed(_kind: str, devices: Iterable[SpiderDevice]) -> None:
+            self.export(devices, account)
+
+        return api.on_refresh(refreshed)
+
+    def export(
+        self,
+        devices: Iterable[SpiderDevice],
+        account: str = "",
+        at: datetime | None = None,
+    ) -> int:
+        """ Write a record per device, returns the number of records """
+        written = 0
+        with self._lock:
+            lines = map(self._format.encode, records(devices, account, at))
+            for batch in batched(lines, self._batch_size):
+                self._sink.write(batch, self._format.header)
+                written += len(batch)
+            self._sink.flush()
+
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            self._sink.close()
@@ -0,0 +1,266 @@
+""" Local fake of the Spider API, to test and benchmark without real devices """
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any, Dict, Tuple, Type
+from urllib.parse import urlparse
+
+from spiderpy.spiderapi import (
+    AUTHENTICATE_PATH,
+    DEVICES_PATH,
+    ENERGY_DEVICES_PATH,
+    ENERGY_MONITORING_PATH,
+    POWER_PLUGS_PATH,
+)
+
+TOKEN_LIFETIME = 3600
+
+
+def fake_thermostat(index: int) -> Dict[str, Any]:
+    """ Thermostat as returned by the devices endpoint """
+    return {
+        "id": f"thermostat-{index}",
+        "name": f"Thermostat {index}",
+        "type": 105,
+        "model": "Spider Thermostat",
+        "manufacturer": "Itho Daalderop",
+        "isOnline": True,
+        "properties": [
+            {"id": "AmbientTemperature", "status": "20.5"},
+            {
+                "id": "SetpointTemperature",
+                "status": "21.0",
+                "min": "5",
+                "max": "30",
+                "step": "0.5",
+                "statusModified": False,
+            },
+            {
+                "id": "OperationMode",
+                "status": "Heat",
+                "statusModified": False,
+                "scheduleChoices": [
+                    {"value": "Heat", "disabled": False},
+                    {"value": "Cool", "disabled": False},
+                ],
+            },
+            {
+                "id": "FanSpeed",
+                "status": "Auto",
+                "statusModified": False,
+                "scheduleChoices": [
+                    {"value": "Auto", "disabled": False},
+                    {"value": "Low", "disabled": False},
+                    {"value": "High", "disabled": False},
+                ],
+            },
+        ],
+    }
+
+
+def fake_power_plug(index: int) -> Dict[str, Any]:
+    """ Power plug as returned by the energy devices endpoint """
+    return {
+        "id": f"plug-{index}",
+        "name": f"Power plug {index}",
+        "type": 103,
+        "model": "Spider Smart Plug",
+        "manufacturer": "Itho Daalderop",
+        "energyDeviceId": f"energy-{index}",
+        "isSwitch": True,
+        "isSwitchable": True,
+        "isOnline": True,
+        "isSwitchedOn": True,
+        "currentUsage": 10.0 + index,
+    }
+
+
+class FakeSpiderServer:
+    """ Spider API on localhost, with a configurable number of devices
+
+    Every request waits latency seconds. The given fraction of requests fails
+    with a 500, except logging in, so a benchmark can always start. Listings carry an ETag, so unchanged ones are
+    answered with a 304. Use change() to make the next listings differ.
+    """
+
+    def __init__(
+        self,
+        thermostats: int = 2,
+        power_plugs: int = 2,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        token_lifetime: int = TOKEN_LIFETIME,
+        seed: int | None = None,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.token_lifetime = token_lifetime
+        self.thermostats = {
+            thermostat["id"]: thermostat
+            for thermostat in map(fake_thermostat, range(thermostats))
+        }
+        self.power_plugs = {
+            power_plug["id"]: power_plug
+            for power_plug in map(fake_power_plug, range(power_plugs))
+        }
+        self.requests: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="spiderpy-fake", daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def __enter__(self) -> FakeSpiderServer:
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def change(self) -> None:
+        """ Move the ambient temperature and usage of every device a little """
+        with self._lock:
+            for thermostat in self.thermostats.values():
+                ambient = thermostat["properties"][0]
+                ambient["status"] = str(round(float(ambient["status"]) + 0.1, 1))
+            for power_plug in self.power_plugs.values():
+                power_plug["currentUsage"] = round(power_plug["currentUsage"] + 0.5, 1)
+
+    def count(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def fails(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        """ Status and response of a request """
+        if method == "POST" and path == AUTHENTICATE_PATH:
+            self.count("tokens")
+            return 200, {
+                "access_token": "fake-access-token",
+                "refresh_token": "fake-refresh-token",
+                "expires_in": self.token_lifetime,
+            }
+
+        if method == "GET" and path == DEVICES_PATH:
+            self.count("devices")
+            with self._lock:
+                return 200, list(self.thermostats.values())
+
+        if method == "GET" and path == ENERGY_DEVICES_PATH:
+            self.count("energy_devices")
+            with self._lock:
+                return 200, list(self.power_plugs.values())
+
+        if method == "GET" and path.startswith(ENERGY_MONITORING_PATH + "/"):
+            self.count("monitoring")
+            return 200, [{"totalEnergy": {"normal": 1.5, "low": 0.5}}]
+
+        if path.startswith(POWER_PLUGS_PATH + "/") and path.endswith("/switch"):
+            self.count("power_plug_switch")
+            power_plug_id = path.split("/")[-2]
+            with self._lock:
+                if method != "PUT" or power_plug_id not in self.power_plugs:
+                    return 404, {}
+                self.power_plugs[power_plug_id]["isSwitchedOn"] = json.loads(body)
+            return 200, {}
+
+        if path.startswith(DEVICES_PATH + "/"):
+            self.count("thermostat")
+            thermostat_id = path.rsplit("/", 1)[-1]
+            with self._lock:
+                if thermostat_id not in self.thermostats:
+                    return 404, {}
+                if method == "PUT":
+                    self.thermostats[thermostat_id] = _applied(json.loads(body))
+                    return 200, {}
+                return 200, self.thermostats[thermostat_id]
+
+        return 404, {}
+
+
+def _applied(thermostat: Dict[str, Any]) -> Dict[str, Any]:
+    """ The thermostat as stored by the server, with the modifications applied """
+    for prop in thermostat.get("properties", []):
+        prop["statusModified"] = False
+    return thermostat
+
+
+def _handler(server: FakeSpiderServer) -> Type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            self._respond()
+
+        def do_POST(self) -> None:  # pylint: disable=invalid-name
+            self._respond()
+
+        def do_PUT(self) -> None:  # pylint: disable=invalid-name
+            self._respond()
+
+        def _respond(self) -> None:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if server.latency:
+                time.sleep(server.latency)
+
+            path = urlparse(self.path).path
+            if path != AUTHENTICATE_PATH and server.fails():
+                server.count("injected_errors")
+                self._write(500, b"{}", {})
+                return
+
+            status, response = server.handle(self.command, path, body)
+            content = json.dumps(response).encode()
+            etag = '"' + hashlib.blake2b(content, digest_size=8).hexdigest() + '"'
+
+            if status == 200 and self.headers.get("If-None-Match") == etag:
+                self._write(304, b"", {"ETag": etag})
+            else:
+                self._write(status, content, {"ETag": etag})
+
+        def _write(self, status: int, content: bytes, headers: Dict[str, str]) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(content)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up waiting
+                pass
+
+    return Handler
@@ -0,0 +1,213 @@
+""" Columnar energy readings of many power plugs, for fleet wide reports """
+from __future__ import annotations
+
+import heapq
+import threading
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # type: ignore[assignment]
+
+from spiderpy.devices.powerplug import SpiderPowerPlug
+from spiderpy.energyhistory import EnergyHistory
+
+COLUMNS = ("current", "today")
+PERCENTILES = (50.0, 90.0, 99.0)
+
+
+class _Rows:
+    """ Readings of the power plugs of one account, or of all accounts joined """
+
+    def __init__(self) -> None:
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.accounts = array("q")
+        self.columns = {column: array("d") for column in COLUMNS}
+        self.histories: List[EnergyHistory | None] = []
+        self.vectors: Dict[str, Any] = {}
+        self.groups: Dict[str, Tuple[List[str], Any]] = {}
+        self.buckets: Dict[Tuple[int, int], Tuple[Any, float]] = {}
+
+    def extend(self, rows: _Rows, account: int) -> None:
+        self.ids.extend(rows.ids)
+        self.names.extend(rows.names)
+        self.accounts.extend([account] * len(rows.ids))
+        for column in COLUMNS:
+            self.columns[column].extend(rows.columns[column])
+        self.histories.extend(rows.histories)
+
+
+class FleetEnergy:
+    """ Energy readings of the power plugs of one or more accounts, in columns
+
+    Every refresh of the power plugs of an account replaces its rows, the rows
+    of all accounts are joined by the first query after that. Readings are the
+    current usage and the usage of today, queries use NumPy when installed.
+    """
+
+    def __init__(self, use_numpy: bool = True) -> None:
+        self._use_numpy = use_numpy and numpy is not None
+        self._lock = threading.Lock()
+        self._accounts: Dict[str, _Rows] = {}
+        self._joined: _Rows | None = None
+
+    def __len__(self) -> int:
+        return len(self._rows().ids)
+
+    @property
+    def accounts(self) -> List[str]:
+        return list(self._accounts)
+
+    def update(self, account: str, power_plugs: Iterable[SpiderPowerPlug]) -> None:
+        """ Replace the readings of the power plugs of an account """
+        rows = _Rows()
+        for power_plug in power_plugs:
+            rows.ids.append(power_plug.id)
+            rows.names.append(power_plug.name)
+            rows.columns["current"].append(power_plug.current_energy_consumption)
+            rows.columns["today"].append(power_plug.today_energy_consumption)
+            rows.histories.append(power_plug.energy_history)
+
+        with self._lock:
+            self._accounts[account] = rows
+            self._joined = None
+
+    def remove(self, account: str) -> None:
+        with self._lock:
+            if self._accounts.pop(account, None) is not None:
+                self._joined = None
+
+    def total(self, column: str = "current") -> float:
+        """ Sum of a column over all power plugs """
+        rows = self._rows()
+        if self._use_numpy:
+            return float(self._vector(rows, column).sum())
+
+        return sum(rows.columns[column])
+
+    def top(self, count: int, column: str = "current") -> List[Tuple[str, float]]:
+        """ The count power plugs with the highest value, as (id, value) """
+        rows = self._rows()
+        values = rows.columns[column]
+        count = min(count, len(values))
+        if count <= 0:
+            return []
+
+        if self._use_numpy:
+            vector = self._vector(rows, column)
+            indexes = numpy.argpartition(-vector, count - 1)[:count]
+            indexes = indexes[numpy.argsort(-vector[indexes], kind="stable")]
+            return [(rows.ids[index], float(vector[index])) for index in indexes]
+
+        largest = heapq.nlargest(count, range(len(values)), key=values.__getitem__)
+        return [(rows.ids[index], values[index]) for index in largest]
+
+    def by_account(self, column: str = "current") -> Dict[str, float]:
+        """ Sum of a column per account """
+        rows = self._rows()
+        return self._grouped(rows, column, list(self._accounts), rows.accounts)
+
+    def by_name_prefix(
+        self, column: str = "current", separator: str = " "
+    ) -> Dict[str, float]:
+        """ Sum of a column per name prefix, the part of the name before separator """
+        rows = self._rows()
+        group = rows.groups.get(separator)
+        if group is None:
+            keys: Dict[str, int] = {}
+            indexes = array(
+                "q",
+                (
+                    keys.setdefault(name.split(separator, 1)[0], len(keys))
+                    for name in rows.names
+                ),
+            )
+            group = rows.groups[separator] = (list(keys), indexes)
+
+        return self._grouped(rows, column, *group)
+
+    def bucket_stats(
+        self,
+        start: datetime,
+        end: datetime,
+        percentiles: Sequence[float] = PERCENTILES,
+    ) -> Dict[str, float]:
+        """ Minimum, maximum, mean and percentiles of the quarter-hour energy buckets
+
+        Covers the buckets of all power plugs starting in [start, end). Empty
+        when there are none. The buckets of a window are gathered and sorted
+        once per refresh, so pass the same start and end to repeat a query.
+        """
+        rows = self._rows()
+        window = int(start.timestamp()), int(end.timestamp())
+        summary = rows.buckets.get(window)
+        if summary is None:
+            buckets = array("d")
+            for history in rows.histories:
+                if history is not None:
+                    buckets.extend(history.between(*window))
+
+            if not buckets:
+                return {}
+
+            if self._use_numpy:
+                vector = numpy.frombuffer(buckets, dtype=numpy.float64)
+                summary = numpy.sort(vector), float(vector.mean())
+            else:
+                summary = sorted(buckets), sum(buckets) / len(buckets)
+            rows.buckets[window] = summary
+
+        ordered, mean = summary
+        stats = {"min": float(ordered[0]), "max": float(ordered[-1]), "mean": mean}
+        for percentile in percentiles:
+            stats[f"p{percentile:g}"] = _percentile(ordered, percentile)
+        return stats
+
+    def _rows(self) -> _Rows:
+        with self._lock:
+            if self._joined is None:
+                joined = _Rows()
+                for account, rows in enumerate(self._accounts.values()):
+                    joined.extend(rows, account)
+                self._joined = joined
+
+            return self._joined
+
+    @staticmethod
+    def _vector(rows: _Rows, column: str) -> Any:
+        vector = rows.vectors.get(column)
+        if vector is None:
+            vector = rows.vectors[column] = numpy.frombuffer(
+                rows.columns[column], dtype=numpy.float64
+            )
+        return vector
+
+    def _grouped(
+        self, rows: _Rows, column: str, keys: List[str], indexes: array[int]
+    ) -> Dict[str, float]:
+        if self._use_numpy:
+            sums = numpy.bincount(
+                numpy.frombuffer(indexes, dtype=numpy.int64),
+                weights=self._vector(rows, column),
+                minlength=len(keys),
+            )
+            return {key: float(value) for key, value in zip(keys, sums)}
+
+        totals = [0.0] * len(keys)
+        for index, value in zip(indexes, rows.columns[column]):
+            totals[index] += value
+        return dict(zip(keys, totals))
+
+
+def _percentile(ordered: Any, percentile: float) -> float:
+    """ Percentile of a sorted list or array, interpolated linearly as NumPy does """
+    position = (len(ordered) - 1) * percentile / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return float(
+        ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+    )
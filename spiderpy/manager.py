@@ -0,0 +1,203 @@
+""" Management of many Spider accounts sharing one client setup """
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Set, ValuesView
+
+from spiderpy.devices.powerplug import SpiderPowerPlug
+from spiderpy.devices.thermostat import SpiderThermostat
+from spiderpy.fleet import FleetEnergy
+from spiderpy.ratelimit import TokenBucket
+from spiderpy.scheduler import RefreshSchedule
+from spiderpy.session import POOL_SIZE, create_session
+from spiderpy.spiderapi import ENERGY_CONCURRENCY, REFRESH_RATE, SpiderApi
+
+RATE_LIMIT = 5.0
+RATE_BURST = 10
+REFRESH_WORKERS = 4
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SpiderAccountManager:
+    """ Many accounts sharing one connection pool, worker pool and rate limit
+
+    With start(), accounts are refreshed in the background, the most overdue
+    account first, so every account gets its turn while the total request rate
+    stays within the rate limit. The power plug readings of all accounts are
+    kept together in fleet, for reports over every account at once.
+    """
+
+    def __init__(
+        self,
+        rate_limit: float = RATE_LIMIT,
+        rate_burst: int = RATE_BURST,
+        refresh_rate: int = REFRESH_RATE,
+        pool_size: int = POOL_SIZE,
+        refresh_workers: int = REFRESH_WORKERS,
+        energy_concurrency: int = ENERGY_CONCURRENCY,
+    ) -> None:
+        self._session = create_session(pool_size)
+        self._rate_limiter = TokenBucket(rate_limit, rate_burst)
+        self._refresh_rate = refresh_rate
+        self._refresh_workers = refresh_workers
+        self._energy_executor = ThreadPoolExecutor(
+            max_workers=energy_concurrency, thread_name_prefix="spiderpy-energy"
+        )
+        self._fleet = FleetEnergy()
+        self._accounts: Dict[str, SpiderApi] = {}
+        self._schedules: Dict[str, RefreshSchedule] = {}
+        self._in_flight: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._refresh_executor: ThreadPoolExecutor | None = None
+
+    @property
+    def accounts(self) -> List[str]:
+        return list(self._accounts)
+
+    @property
+    def fleet(self) -> FleetEnergy:
+        return self._fleet
+
+    def add_account(self, username: str, password: str, **kwargs: Any) -> SpiderApi:
+        """ Register an account, extra arguments are passed on to SpiderApi """
+        api = SpiderApi(
+            username,
+            password,
+            refresh_rate=self._refresh_rate,
+            session=self._session,
+            executor=self._energy_executor,
+            rate_limiter=self._rate_limiter,
+            fleet=self._fleet,
+            **kwargs,
+        )
+        api.refresh_on_read = self._thread is None
+
+        with self._lock:
+            previous = self._accounts.pop(username, None)
+            self._accounts[username] = api
+            self._schedules[username] = RefreshSchedule(self._refresh_rate)
+
+        if previous is not None:
+            previous.close()
+
+        self._wake.set()
+        return api
+
+    def remove_account(self, username: str) -> None:
+        with self._lock:
+            api = self._accounts.pop(username, None)
+            self._schedules.pop(username, None)
+        self._fleet.remove(username)
+
+        if api is not None:
+            api.close()
+
+    def get_account(self, username: str) -> SpiderApi | None:
+        return self._accounts.get(username)
+
+    def get_thermostats(self) -> Dict[str, ValuesView[SpiderThermostat]]:
+        """ Thermostats per account """
+        return {
+            username: api.get_thermostats()
+            for username, api in list(self._accounts.items())
+        }
+
+    def get_power_plugs(self) -> Dict[str, ValuesView[SpiderPowerPlug]]:
+        """ Power plugs per account """
+        return {
+            username: api.get_power_plugs()
+            for username, api in list(self._accounts.items())
+        }
+
+    def start(self) -> None:
+        """ Refresh all accounts in the background """
+        if self._thread is not None:
+            return
+
+        self._stopped.clear()
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=self._refresh_workers, thread_name_prefix="spiderpy-manager"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="spiderpy-manager", daemon=True
+        )
+        self._thread.start()
+
+        for api in list(self._accounts.values()):
+            api.refresh_on_read = False
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+        for api in list(self._accounts.values()):
+            api.refresh_on_read = True
+
+        if self._refresh_executor is not None:
+            self._refresh_executor.shutdown()
+            self._refresh_executor = None
+
+    def close(self) -> None:
+        self.stop()
+
+        for username in list(self._accounts):
+            self.remove_account(username)
+
+        self._energy_executor.shutdown()
+        self._session.close()
+
+    def _run(self) -> None:
+        executor = self._refresh_executor
+        while executor is not None and not self._stopped.is_set():
+            now = time.monotonic()
+            with self._lock:
+                waiting = sorted(
+                    (schedule.next_run, username)
+                    for username, schedule in self._schedules.items()
+                    if username not in self._in_flight
+                )
+
+            next_delay = float(self._refresh_rate)
+            for next_run, username in waiting:
+                if next_run > now:
+                    next_delay = min(next_delay, next_run - now)
+                    break
+
+                with self._lock:
+                    self._in_flight.add(username)
+                executor.submit(self._refresh, username)
+
+            self._wake.wait(next_delay)
+            self._wake.clear()
+
+    def _refresh(self, username: str) -> None:
+        api = self._accounts.get(username)
+        schedule = self._schedules.get(username)
+
+        try:
+            if api is None or schedule is None:
+                return
+
+            try:
+                api.update_thermostats()
+                api.update_power_plugs()
+                schedule.succeeded(time.monotonic())
+            except Exception:  # pylint: disable=broad-except
+                schedule.failed(time.monotonic())
+                _LOGGER.exception(f"Unable to refresh account {username}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(username)
+            self._wake.set()
@@ -0,0 +1,140 @@
+""" Instrumentation of the requests to the Spider API """
+from __future__ import annotations
+
+import bisect
+import threading
+from collections import defaultdict
+from typing import DefaultDict, Dict, List, Tuple
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    """ Hooks called by the client, subclass it to forward them to a tracer
+
+    All hooks do nothing by default. A client without metrics skips them
+    altogether, so leaving them out costs nothing.
+    """
+
+    def request(
+        self,
+        endpoint: str,
+        method: str,
+        status: int | None,
+        duration: float,
+        bytes_sent: int,
+        bytes_received: int,
+    ) -> None:
+        """ A request finished, status is None when no response was received """
+
+    def token_renewed(self, kind: str) -> None:
+        """ The token was renewed, kind is login, refresh or stored """
+
+    def cache(self, endpoint: str, hit: bool) -> None:
+        """ A conditional request was answered from the cache or not """
+
+    def stage(self, stage: str, duration: float) -> None:
+        """ Time spent parsing responses or building devices """
+
+
+class RequestStats(Metrics):
+    """ Metrics kept in memory, with an export in the Prometheus text format """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.requests: DefaultDict[Tuple[str, str, str], int] = defaultdict(int)
+        self.latency: Dict[str, List[int]] = {}
+        self.latency_sum: DefaultDict[str, float] = defaultdict(float)
+        self.bytes_sent: DefaultDict[str, int] = defaultdict(int)
+        self.bytes_received: DefaultDict[str, int] = defaultdict(int)
+        self.token_renewals: DefaultDict[str, int] = defaultdict(int)
+        self.cache_hits: DefaultDict[str, int] = defaultdict(int)
+        self.cache_misses: DefaultDict[str, int] = defaultdict(int)
+        self.stages: DefaultDict[str, float] = defaultdict(float)
+        self.stage_counts: DefaultDict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def request(
+        self,
+        endpoint: str,
+        method: str,
+        status: int | None,
+        duration: float,
+        bytes_sent: int,
+        bytes_received: int,
+    ) -> None:
+        with self._lock:
+            self.requests[(endpoint, method, str(status or "error"))] += 1
+            counts = self.latency.setdefault(endpoint, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, duration)] += 1
+            self.latency_sum[endpoint] += duration
+            self.bytes_sent[endpoint] += bytes_sent
+            self.bytes_received[endpoint] += bytes_received
+
+    def token_renewed(self, kind: str) -> None:
+        with self._lock:
+            self.token_renewals[kind] += 1
+
+    def cache(self, endpoint: str, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.cache_hits[endpoint] += 1
+            else:
+                self.cache_misses[endpoint] += 1
+
+    def stage(self, stage: str, duration: float) -> None:
+        with self._lock:
+            self.stages[stage] += duration
+            self.stage_counts[stage] += 1
+
+    def prometheus(self, prefix: str = "spiderpy") -> str:
+        """ The metrics in the Prometheus text exposition format """
+        with self._lock:
+            lines: List[str] = []
+
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                labels = f'endpoint="{endpoint}",method="{method}",status="{status}"'
+                lines.append(f"{prefix}_requests_total{{{labels}}} {count}")
+
+            lines.append(f"# TYPE {prefix}_request_duration_seconds histogram")
+            for endpoint, counts in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(
+                        f'{prefix}_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{le}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'{prefix}_request_duration_seconds_sum{{endpoint="{endpoint}"}} {self.latency_sum[endpoint]}'
+                )
+                lines.append(
+                    f'{prefix}_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}'
+                )
+
+            for name, values in (
+                ("sent_bytes_total", self.bytes_sent),
+                ("received_bytes_total", self.bytes_received),
+                ("cache_hits_total", self.cache_hits),
+                ("cache_misses_total", self.cache_misses),
+            ):
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for endpoint, value in sorted(values.items()):
+                    lines.append(f'{prefix}_{name}{{endpoint="{endpoint}"}} {value}')
+
+            lines.append(f"# TYPE {prefix}_token_renewals_total counter")
+            for kind, count in sorted(self.token_renewals.items()):
+                lines.append(f'{prefix}_token_renewals_total{{kind="{kind}"}} {count}')
+
+            lines.append(f"# TYPE {prefix}_stage_seconds_total counter")
+            for stage, duration in sorted(self.stages.items()):
+                lines.append(
+                    f'{prefix}_stage_seconds_total{{stage="{stage}"}} {duration}'
+                )
+
+            lines.append(f"# TYPE {prefix}_stage_runs_total counter")
+            for stage, count in sorted(self.stage_counts.items()):
+                lines.append(f'{prefix}_stage_runs_total{{stage="{stage}"}} {count}')
+
+            return "\n".join(lines) + "\n"
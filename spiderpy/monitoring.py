@@ -0,0 +1,35 @@
+""" Energy usage per quarter-hour bucket, from the monitoring endpoint of the Spider API """
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from spiderpy.energyhistory import day_start
+
+ENERGY_MONITORING_PATH = "/api/monitoring/15/devices"
+
+
+def energy_monitoring_path(
+    energy_device_id: str, start: int | None = None, take: int = 96
+) -> str:
+    """ Monitoring path for take quarter-hour buckets, by default the whole of today """
+    if start is None:
+        start = day_start(int(time.time()))
+
+    return (
+        ENERGY_MONITORING_PATH
+        + "/"
+        + energy_device_id
+        + "/?take="
+        + str(take)
+        + "&start="
+        + str(start)
+        + "000"
+    )
+
+
+def parse_total_energy(energy_results: Any) -> float:
+    """ Sum the normal and low tariff energy of a monitoring response """
+    return float(energy_results[0]["totalEnergy"]["normal"]) + float(
+        energy_results[0]["totalEnergy"]["low"]
+    )
@@ -0,0 +1,34 @@
+""" Rate limiting of the requests to the Spider API """
+from __future__ import annotations
+
+import threading
+import time
+
+
+class TokenBucket:
+    """ Allow rate requests per second on average, with bursts of up to burst requests """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """ Wait until a request is allowed """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._burst, self._tokens + (now - self._updated_at) * self._rate
+                )
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self._rate
+
+            time.sleep(wait)
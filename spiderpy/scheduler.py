@@ -0,0 +1,139 @@
+""" Background refreshing of the device cache """
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, List, Tuple
+
+REFRESH_AHEAD = 0.9
+JITTER = 0.1
+RETRY_DELAY = 5.0
+TIGHTEN_FACTOR = 0.5
+RELAX_FACTOR = 1.25
+BOOST_DURATION = 60.0
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AdaptiveInterval:
+    """ Refresh interval following how often the data actually changes
+
+    Every refresh that finds a change halves the interval, every refresh that
+    does not grows it by a quarter, within the minimum and maximum. After a
+    local change the minimum is used for a while, to confirm it quickly.
+    Without a minimum and maximum the interval is fixed.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        minimum: float | None = None,
+        maximum: float | None = None,
+        boost_duration: float = BOOST_DURATION,
+    ) -> None:
+        self._interval = float(interval)
+        self.minimum = self._interval if minimum is None else float(minimum)
+        self.maximum = self._interval if maximum is None else float(maximum)
+        self._boost_duration = boost_duration
+        self._boost_until = 0.0
+
+    def __float__(self) -> float:
+        if time.monotonic() < self._boost_until:
+            return self.minimum
+
+        return self._interval
+
+    def observe(self, changed: bool) -> None:
+        factor = TIGHTEN_FACTOR if changed else RELAX_FACTOR
+        self._interval = min(self.maximum, max(self.minimum, self._interval * factor))
+
+    def boost(self) -> None:
+        self._boost_until = time.monotonic() + self._boost_duration
+
+
+class RefreshSchedule:
+    """ When to run a refresh next
+
+    A refresh is planned ahead of the interval expiring, spread with jitter so
+    clients started together do not refresh together. Failures are retried with
+    exponential backoff, never waiting longer than the interval.
+    """
+
+    def __init__(
+        self,
+        interval: float | AdaptiveInterval,
+        refresh_ahead: float = REFRESH_AHEAD,
+        jitter: float = JITTER,
+        retry_delay: float = RETRY_DELAY,
+    ) -> None:
+        self.interval = interval
+        self._refresh_ahead = refresh_ahead
+        self._jitter = jitter
+        self._retry_delay = retry_delay
+        self.failures = 0
+        self.next_run = 0.0
+
+    def _spread(self, delay: float) -> float:
+        return delay * random.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def succeeded(self, now: float) -> None:
+        self.failures = 0
+        self.next_run = now + self._spread(float(self.interval) * self._refresh_ahead)
+
+    def failed(self, now: float) -> None:
+        self.failures += 1
+        delay = min(float(self.interval), self._retry_delay * 2 ** (self.failures - 1))
+        self.next_run = now + self._spread(delay)
+
+    def delay(self, now: float) -> float:
+        return max(0.0, self.next_run - now)
+
+
+class BackgroundRefresher:
+    """ Daemon thread running refresh functions according to their schedule """
+
+    def __init__(self, jobs: List[Tuple[Callable[[], Any], RefreshSchedule]]) -> None:
+        self._jobs = jobs
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="spiderpy-refresh", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def expedite(self, refresh: Callable[[], Any], delay: float) -> None:
+        """ Run a refresh within delay seconds, if it was planned later """
+        for job, schedule in self._jobs:
+            if job == refresh:
+                schedule.next_run = min(schedule.next_run, time.monotonic() + delay)
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            now = time.monotonic()
+            for refresh, schedule in self._jobs:
+                if schedule.delay(now) > 0:
+                    continue
+
+                try:
+                    refresh()
+                    schedule.succeeded(time.monotonic())
+                except Exception:  # pylint: disable=broad-except
+                    schedule.failed(time.monotonic())
+                    _LOGGER.exception(
+                        f"Background refresh failed {schedule.failures} time(s)"
+                    )
+
+            now = time.monotonic()
+            self._wake.wait(min(schedule.delay(now) for _, schedule in self._jobs))
+            self._wake.clear()
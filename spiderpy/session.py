@@ -0,0 +1,29 @@
+""" Keep-alive sessions for the requests to the Spider API """
+from __future__ import annotations
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_SIZE = 10
+RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+
+def create_session(
+    pool_size: int = POOL_SIZE, retries: int = RETRIES
+) -> requests.Session:
+    """ Session with a keep-alive connection pool that retries failed idempotent requests """
+    retry = Retry(
+        total=retries,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,41 @@
+""" Collapsing of concurrent calls into a single call """
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """ Run a function once per key at a time
+
+    Threads calling with a key that is already in flight wait for that call and
+    share its result, or its exception.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future[Any]] = {}
+
+    def do(self, key: str, function: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = function()
+            call.set_result(result)
+            return result
+        except BaseException as exception:
+            call.set_exception(exception)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -0,0 +1,109 @@
+""" Snapshots of the device cache on disk, to start warm after a restart """
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+
+from spiderpy.devices.base import SpiderDevice
+from spiderpy.energyhistory import EnergyHistory
+
+MAGIC = b"spiderpy-snapshot"
+SNAPSHOT_VERSION = 2
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Snapshot:
+    """ Raw device data and energy buckets, as last received from the API """
+
+    saved_at: float = field(default_factory=time.time)
+    thermostats: List[Dict[str, Any]] = field(default_factory=list)
+    power_plugs: List[Dict[str, Any]] = field(default_factory=list)
+    energy: Dict[str, Tuple[List[int], List[float], List[int]]] = field(
+        default_factory=dict
+    )
+
+    @classmethod
+    def capture(
+        cls,
+        thermostats: Iterable[SpiderDevice],
+        power_plugs: Iterable[SpiderDevice],
+        energy_history: Dict[str, EnergyHistory],
+    ) -> Snapshot:
+        return cls(
+            thermostats=[thermostat.data for thermostat in thermostats],
+            power_plugs=[power_plug.data for power_plug in power_plugs],
+            energy={
+                energy_device_id: history.buckets()
+                for energy_device_id, history in energy_history.items()
+            },
+        )
+
+    def restore_energy_history(self, retention: int) -> Dict[str, EnergyHistory]:
+        histories = {}
+        for energy_device_id, (starts, values, sizes) in self.energy.items():
+            history = EnergyHistory(retention)
+            for start, energy, size in zip(starts, values, sizes):
+                history.record(start, energy, size)
+            histories[energy_device_id] = history
+
+        return histories
+
+
+def write_snapshot(path: str, snapshot: Snapshot) -> None:
+    """ Write the snapshot compressed, replacing the previous one atomically """
+    content = json.dumps(
+        {
+            "saved_at": snapshot.saved_at,
+            "thermostats": snapshot.thermostats,
+            "power_plugs": snapshot.power_plugs,
+            "energy": snapshot.energy,
+        },
+        separators=(",", ":"),
+    ).encode()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as snapshot_file:
+            snapshot_file.write(MAGIC + b" " + str(SNAPSHOT_VERSION).encode() + b"\n")
+            snapshot_file.write(zlib.compress(content))
+        os.chmod(temporary_path, 0o600)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def read_snapshot(path: str) -> Snapshot | None:
+    """ Read a snapshot, None when it is missing, damaged or of another version """
+    try:
+        with open(path, "rb") as snapshot_file:
+            header = snapshot_file.readline().split()
+            if header != [MAGIC, str(SNAPSHOT_VERSION).encode()]:
+                _LOGGER.warning(f"Ignoring snapshot {path} of an unknown version")
+                return None
+
+            data = json.loads(zlib.decompress(snapshot_file.read()))
+
+        return Snapshot(
+            data["saved_at"],
+            data["thermostats"],
+            data["power_plugs"],
+            {
+                energy_device_id: (starts, values, sizes)
+                for energy_device_id, (starts, values, sizes) in data["energy"].items()
+            },
+        )
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, zlib.error):
+        _LOGGER.warning(f"Ignoring damaged snapshot {path}")
+        return None
@@ -1,95 +1,497 @@
 """ Python wrapper for the Spider API """
 from __future__ import annotations
 
-import json
 import logging
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Dict, ValuesView
+from types import TracebackType
+from typing import Any, Callable, Dict, Iterable, List, Type, TypeVar, ValuesView
 from urllib.parse import unquote
 
 import requests
 
+from spiderpy.bulk import BulkReport
+from spiderpy.changes import DeviceChanges, reconcile
+from spiderpy.circuitbreaker import FAILURE_THRESHOLD, RESET_TIMEOUT, Circuits
+from spiderpy.codec import JSON_CODEC, JsonCodec
+from spiderpy.commandqueue import DEBOUNCE, CommandQueue
+from spiderpy.conditional import ConditionalCache
+from spiderpy.devices.base import SpiderDevice
 from spiderpy.devices.powerplug import SpiderPowerPlug
 from spiderpy.devices.thermostat import SpiderThermostat
+from spiderpy.energyhistory import RETENTION, EnergyHistory
+from spiderpy.exceptions import SpiderApiException, UnauthorizedException
+from spiderpy.fleet import FleetEnergy
+from spiderpy.metrics import Metrics
+from spiderpy.monitoring import (
+    ENERGY_MONITORING_PATH,
+    energy_monitoring_path,
+    parse_total_energy,
+)
+from spiderpy.ratelimit import TokenBucket
+from spiderpy.scheduler import AdaptiveInterval, BackgroundRefresher, RefreshSchedule
+from spiderpy.session import POOL_SIZE, RETRIES, create_session
+from spiderpy.singleflight import SingleFlight
+from spiderpy.snapshot import Snapshot, read_snapshot, write_snapshot
+from spiderpy.subscriptions import ChangeCallback, RefreshCallback, Subscriptions
+from spiderpy.tokenstore import MemoryTokenStore, Token, TokenStore
 
 BASE_URL = "https://spider-api.ithodaalderop.nl"
 
-AUTHENTICATE_URL = BASE_URL + "/api/tokens"
-DEVICES_URL = BASE_URL + "/api/devices"
-ENERGY_DEVICES_URL = BASE_URL + "/api/devices/energy/energyDevices"
-POWER_PLUGS_URL = BASE_URL + "/api/devices/energy/smartPlugs"
-ENERGY_MONITORING_URL = BASE_URL + "/api/monitoring/15/devices"
+AUTHENTICATE_PATH = "/api/tokens"
+DEVICES_PATH = "/api/devices"
+ENERGY_DEVICES_PATH = "/api/devices/energy/energyDevices"
+POWER_PLUGS_PATH = "/api/devices/energy/smartPlugs"
+
+AUTHENTICATE_URL = BASE_URL + AUTHENTICATE_PATH
+DEVICES_URL = BASE_URL + DEVICES_PATH
+ENERGY_DEVICES_URL = BASE_URL + ENERGY_DEVICES_PATH
+POWER_PLUGS_URL = BASE_URL + POWER_PLUGS_PATH
+ENERGY_MONITORING_URL = BASE_URL + ENERGY_MONITORING_PATH
+
+CLIENT_HEADERS = {
+    "X-Client-Platform": "android-phone",
+    "X-Client-Version": "1.5.9 (3611)",
+    "X-Client-Library": "SpiderPy",
+}
 
 REFRESH_RATE = 120
 
+TIMEOUT = 10
+TOKEN_REFRESH_MARGIN = 60
+ENERGY_CONCURRENCY = 8
+
 _LOGGER = logging.getLogger(__name__)
 
+DeviceType = TypeVar("DeviceType", bound=SpiderDevice)
+
 
 class SpiderApi:
     """ Interface class for the Spider API """
 
     def __init__(
-        self, username: str, password: str, refresh_rate: int = REFRESH_RATE
+        self,
+        username: str,
+        password: str,
+        refresh_rate: int = REFRESH_RATE,
+        base_url: str = BASE_URL,
+        session: requests.Session | None = None,
+        pool_size: int = POOL_SIZE,
+        timeout: float = TIMEOUT,
+        retries: int = RETRIES,
+        energy_concurrency: int = ENERGY_CONCURRENCY,
+        energy_retention: int = RETENTION,
+        command_debounce: float = DEBOUNCE,
+        token_store: TokenStore | None = None,
+        executor: ThreadPoolExecutor | None = None,
+        rate_limiter: TokenBucket | None = None,
+        json_codec: JsonCodec = JSON_CODEC,
+        min_refresh_rate: int | None = None,
+        max_refresh_rate: int | None = None,
+        metrics: Metrics | None = None,
+        single_device_reads: bool = False,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        fleet: FleetEnergy | None = None,
     ) -> None:
-        """ Constructor """
-        self._username = ""
-        for char in username:
-            self._username += hex(ord(char)).lstrip("0x")
+        """ Constructor. Pass a session, executor and rate limiter to share them between clients
+
+        With single_device_reads, get_thermostat() refreshes only the requested
+        thermostat, through its own endpoint, instead of listing all devices.
+
+        After failure_threshold consecutive failures of an endpoint class, its
+        requests are refused for reset_timeout seconds, doubling while it fails.
+
+        With a fleet, the readings of the power plugs are also kept in its
+        columns, under the username.
+        """
+        self._username = encode_username(username)
+        self._account = username
+        self._fleet = fleet
         self._password = password
+        self._base_url = base_url.rstrip("/")
+        self._session = session or create_session(pool_size, retries)
+        self._owns_session = session is None
+        self._timeout = timeout
+        self._energy_concurrency = energy_concurrency
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._energy_retention = energy_retention
+        self._energy_history: Dict[str, EnergyHistory] = {}
+        self._subscriptions = Subscriptions()
+        self._single_flight = SingleFlight()
+        self._commands = CommandQueue(self._send_thermostat, command_debounce)
+        self._thermostats_updated_at: datetime | None = None
+        self._power_plugs_updated_at: datetime | None = None
+        self._refresher: BackgroundRefresher | None = None
+        self._warm_up: threading.Thread | None = None
+        self._closing = threading.Event()
         self._thermostats: Dict[Any, Any] = {}
+        # Listing and single thermostat refreshes run under different keys
+        self._thermostats_lock = threading.Lock()
         self._power_plugs: Dict[Any, Any] = {}
-        self._last_refresh: int = 0
+        self._thermostat_results: List[Dict[Any, Any]] = []
+        self._power_plug_results: List[Dict[Any, Any]] = []
         self._access_token: str = ""
         self._refresh_token: str = ""
         self._token_expires_at = datetime.now() - timedelta(days=1)
         self._token_expires_in = None
+        self._token_store = token_store or MemoryTokenStore()
+        self._conditional = ConditionalCache()
+        self._json = json_codec
+        self._metrics = metrics
         self._refresh_rate: int = refresh_rate
+        self._intervals = {
+            kind: AdaptiveInterval(refresh_rate, min_refresh_rate, max_refresh_rate)
+            for kind in ("thermostats", "power_plugs")
+        }
+        self._due = {"thermostats": 0.0, "power_plugs": 0.0}
+        self._device_due: Dict[str, float] = {}
+        self._circuits = Circuits(
+            failure_threshold, reset_timeout, rate_limiter, metrics
+        )
+        self._single_device_reads = single_device_reads
+        self.refresh_on_read = True
 
-    def update(self) -> None:
-        """ Update the cache """
-        current_time = int(time.time())
+    def __enter__(self) -> SpiderApi:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """ Close the session, unless it was passed in by the caller """
+        self.stop_background_refresh()
+
+        # The warm start refresh stops after the class it is refreshing
+        self._closing.set()
+        if self._warm_up is not None:
+            self._warm_up.join()
+            self._warm_up = None
+
+        self.flush_commands()
+
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+        if self._owns_session:
+            self._session.close()
+
+    @property
+    def thermostats_updated_at(self) -> datetime | None:
+        """ When the thermostats were last refreshed """
+        return self._thermostats_updated_at
+
+    @property
+    def power_plugs_updated_at(self) -> datetime | None:
+        """ When the power plugs were last refreshed """
+        return self._power_plugs_updated_at
+
+    @property
+    def background_refresh(self) -> bool:
+        return self._refresher is not None
+
+    @property
+    def thermostats_age(self) -> float | None:
+        """ Seconds since the thermostats were last refreshed """
+        return seconds_since(self._thermostats_updated_at)
+
+    @property
+    def power_plugs_age(self) -> float | None:
+        """ Seconds since the power plugs were last refreshed """
+        return seconds_since(self._power_plugs_updated_at)
+
+    @property
+    def stale(self) -> bool:
+        """ Whether the cache holds devices that could not be refreshed
+
+        That is the case for devices restored from a snapshot, and for the last
+        good devices served while the API fails.
+        """
+        return bool(self._circuits.stale)
+
+    @property
+    def circuits(self) -> Dict[str, str]:
+        """ State of the circuit breaker of every endpoint class """
+        return self._circuits.states
+
+    def save_snapshot(self, path: str) -> None:
+        """ Write the cached devices and energy usage to disk, to restore after a restart """
+        write_snapshot(
+            path,
+            Snapshot.capture(
+                self._thermostats.values(),
+                self._power_plugs.values(),
+                self._energy_history,
+            ),
+        )
+
+    def restore_snapshot(self, path: str) -> bool:
+        """ Serve the devices of a snapshot right away and refresh them in the background
+
+        Only an empty cache is restored. Until the refresh is done, stale is true
+        and the updated_at properties tell when the snapshot was taken.
+        """
+        if self._thermostats or self._power_plugs:
+            return False
+
+        snapshot = read_snapshot(path)
+        if snapshot is None:
+            return False
+
+        self._energy_history = snapshot.restore_energy_history(self._energy_retention)
+        self._thermostats = {
+            data["id"]: SpiderThermostat(data) for data in snapshot.thermostats
+        }
+        self._power_plugs = {
+            data["id"]: self._create_power_plug(data) for data in snapshot.power_plugs
+        }
+        self._update_fleet()
+        self._thermostats_updated_at = datetime.fromtimestamp(snapshot.saved_at)
+        self._power_plugs_updated_at = datetime.fromtimestamp(snapshot.saved_at)
+        self._circuits.stale = {"thermostats", "power_plugs"}
+
+        # Getters return the snapshot instead of waiting for the refresh
+        now = time.monotonic()
+        for kind, interval in self._intervals.items():
+            self._due[kind] = now + float(interval)
+
+        self._warm_up = threading.Thread(
+            target=self._refresh_restored, name="spiderpy-warm-start", daemon=True
+        )
+        self._warm_up.start()
+        return True
 
-        if current_time >= (self._last_refresh + self._refresh_rate):
-            self.update_thermostats()
-            self.update_power_plugs()
+    def _refresh_restored(self) -> None:
+        for kind in ("thermostats", "power_plugs"):
+            if self._closing.is_set():
+                return
 
-            self._last_refresh = current_time
+            try:
+                getattr(self, "update_" + kind)()
+            except Exception:  # pylint: disable=broad-except
+                # Let the next getter try again
+                self._due[kind] = 0.0
+                _LOGGER.exception(f"Unable to refresh the restored {kind}")
+
+    def _refresh_on_read(self, kind: str) -> bool:
+        """ Getters refresh when nothing else keeps the cache up to date, or it was never filled """
+        if getattr(self, "_" + kind + "_updated_at") is None:
+            return True
 
-    def update_thermostats(self) -> None:
-        """ Retrieve thermostats """
-        results = self._request_update(DEVICES_URL)
+        return self.refresh_on_read and self._refresher is None
 
-        if results is False:
+    def start_background_refresh(
+        self,
+        thermostat_interval: float | None = None,
+        power_plug_interval: float | None = None,
+    ) -> None:
+        """ Refresh ahead of expiry in a background thread, getters then return the cache """
+        if self._refresher is not None:
             return
 
-        for thermostat in results:
-            if thermostat["type"] == 105:
-                self._thermostats[thermostat["id"]] = SpiderThermostat(thermostat)
+        self._refresher = BackgroundRefresher(
+            [
+                (
+                    self.update_thermostats,
+                    RefreshSchedule(
+                        thermostat_interval or self._intervals["thermostats"]
+                    ),
+                ),
+                (
+                    self.update_power_plugs,
+                    RefreshSchedule(
+                        power_plug_interval or self._intervals["power_plugs"]
+                    ),
+                ),
+            ]
+        )
+        self._refresher.start()
+
+    def stop_background_refresh(self) -> None:
+        if self._refresher is not None:
+            self._refresher.stop()
+            self._refresher = None
+
+    def update(self) -> None:
+        """ Update the cache. Concurrent callers share a single refresh """
+        self._single_flight.do("update", self._update_expired)
+
+    def _update_expired(self) -> None:
+        self._update_kind("thermostats")
+        self._update_kind("power_plugs")
+
+    def _update_kind(self, kind: str) -> None:
+        """ Refresh one class of devices, when it is due """
+        if time.monotonic() >= self._due[kind]:
+            getattr(self, "update_" + kind)()
+
+    def _refresh_for_read(self, kind: str) -> None:
+        """ Refresh before a read, serving the last good devices when that fails """
+        try:
+            self._update_kind(kind)
+        except (SpiderApiException, UnauthorizedException) as exception:
+            if getattr(self, "_" + kind + "_updated_at") is None:
+                raise
+
+            self._circuits.serve_stale(kind, exception)
+
+    def _refreshed(self, kind: str, changes: DeviceChanges) -> None:
+        """ Plan the next refresh, based on whether this one found changes """
+        interval = self._intervals[kind]
+        interval.observe(bool(changes))
+        self._due[kind] = time.monotonic() + float(interval)
+        self._circuits.stale.discard(kind)
+
+    def _expect_change(self, kind: str) -> None:
+        """ Refresh sooner for a while, to confirm a change made by this client """
+        interval = self._intervals[kind]
+        interval.boost()
+        self._due[kind] = min(self._due[kind], time.monotonic() + interval.minimum)
+
+        if self._refresher is not None:
+            self._refresher.expedite(getattr(self, "update_" + kind), interval.minimum)
+
+    def subscribe(
+        self,
+        callback: ChangeCallback,
+        device_id: str | None = None,
+        field: str | None = None,
+    ) -> Callable[[], None]:
+        """ Call back with (device, field, old value, new value) when a refresh changes a value
+
+        Limit it to one device and/or field, such as SetpointTemperature,
+        OperationMode, isSwitchedOn or currentUsage. Returns a function to unsubscribe.
+        """
+        return self._subscriptions.subscribe(callback, device_id, field)
+
+    def on_refresh(self, callback: RefreshCallback) -> Callable[[], None]:
+        """ Call back with (kind, devices) after every refresh, whether it changed anything or not
+
+        Kind is thermostats or power_plugs. Returns a function to stop.
+        """
+        return self._subscriptions.listen(callback)
+
+    def update_thermostats(self) -> DeviceChanges:
+        """ Retrieve thermostats and update the cached ones in place """
+        return self._single_flight.do("thermostats", self._update_thermostats)
+
+    def _update_thermostats(self) -> DeviceChanges:
+        results = self._request_update(self._base_url + DEVICES_PATH, "devices", True)
+
+        if results is None:
+            if not self._has_pending(self._thermostats):
+                self._thermostats_updated_at = datetime.now()
+                self._refreshed("thermostats", DeviceChanges())
+                self._subscriptions.refreshed("thermostats", self._thermostats.values())
+                return DeviceChanges()
+
+            # Reconcile the unchanged listing, so pending changes can expire
+            results = self._thermostat_results
+        else:
+            self._thermostat_results = results
+
+        started = time.perf_counter()
+        thermostats = {
+            thermostat["id"]: thermostat_data(thermostat)
+            for thermostat in results
+            if thermostat["type"] == 105
+        }
+
+        with self._thermostats_lock:
+            self._thermostats, changes = reconcile(
+                self._thermostats, thermostats, SpiderThermostat
+            )
+        if self._metrics is not None:
+            self._metrics.stage("build", time.perf_counter() - started)
+        self._thermostats_updated_at = datetime.now()
+        self._refreshed("thermostats", changes)
+        self._subscriptions.notify(self._thermostats, changes)
+        self._subscriptions.refreshed("thermostats", self._thermostats.values())
+
+        return changes
+
+    def update_thermostat(self, unique_id: str) -> DeviceChanges:
+        """ Retrieve a single thermostat and update the cached one in place """
+        return self._single_flight.do(
+            "thermostat " + unique_id, lambda: self._update_thermostat(unique_id)
+        )
+
+    def _update_thermostat(self, unique_id: str) -> DeviceChanges:
+        result = self._request_update(
+            self._base_url + DEVICES_PATH + "/" + unique_id, "thermostat", True
+        )
+        self._device_due[unique_id] = time.monotonic() + float(
+            self._intervals["thermostats"]
+        )
+
+        if result is None:
+            current = self._thermostats.get(unique_id)
+            if current is not None:
+                self._subscriptions.refreshed("thermostats", [current])
+            return DeviceChanges()
+
+        with self._thermostats_lock:
+            current = self._thermostats.get(unique_id)
+            updated, changes = reconcile(
+                {} if current is None else {unique_id: current},
+                {unique_id: result},
+                SpiderThermostat,
+            )
+            self._thermostats = {**self._thermostats, **updated}
+        self._subscriptions.notify(self._thermostats, changes)
+        self._subscriptions.refreshed("thermostats", updated.values())
+
+        return changes
 
     def get_thermostats(self) -> ValuesView[SpiderThermostat]:
         """ Get all thermostats """
-        self.update()
+        if self._refresh_on_read("thermostats"):
+            self._refresh_for_read("thermostats")
 
         return self._thermostats.values()
 
     def get_thermostat(self, unique_id: str) -> SpiderThermostat | None:
         """ Get a thermostat by id """
-        self.update()
+        if self._refresh_on_read("thermostats"):
+            if self._single_device_reads and unique_id in self._thermostats:
+                self._update_single_thermostat(unique_id)
+            else:
+                self._refresh_for_read("thermostats")
 
         if unique_id in self._thermostats:
             return self._thermostats[unique_id]
 
         return None
 
+    def _update_single_thermostat(self, unique_id: str) -> None:
+        """ Refresh a known thermostat, when neither it nor the listing is fresh """
+        now = time.monotonic()
+        if now < self._due["thermostats"] or now < self._device_due.get(unique_id, 0):
+            return
+
+        try:
+            self.update_thermostat(unique_id)
+        except SpiderApiException:
+            # It may have been removed, the listing tells
+            self._refresh_for_read("thermostats")
+
     def set_temperature(self, thermostat: SpiderThermostat, temperature: float) -> bool:
         """ Set the temperature. Unfortunately, the API requires the complete object"""
         if thermostat.set_temperature(temperature):
-            url = DEVICES_URL + "/" + thermostat.id
             try:
-                self._request_action(url, json.dumps(thermostat.data))
+                self._send_thermostat(thermostat)
                 return True
             except SpiderApiException:
+                thermostat.clear_pending("SetpointTemperature")
                 _LOGGER.error(f"Unable to set temperature to {temperature}.")
         return False
 
@@ -98,11 +500,11 @@ class SpiderApi:
     ) -> bool:
         """ Set the operation mode. Unfortunately, the API requires the complete object"""
         if thermostat.set_operation_mode(operation_mode):
-            url = DEVICES_URL + "/" + thermostat.id
             try:
-                self._request_action(url, json.dumps(thermostat.data))
+                self._send_thermostat(thermostat)
                 return True
             except SpiderApiException:
+                thermostat.clear_pending("OperationMode")
                 _LOGGER.error(
                     f"Unable to set operation mode to {operation_mode}. Is this operation mode supported?"
                 )
@@ -111,62 +513,187 @@ class SpiderApi:
     def set_fan_speed(self, thermostat: SpiderThermostat, fan_speed: str) -> bool:
         """ Set the fan speed. Unfortunately, the API requires the complete object"""
         if thermostat.set_fan_speed(fan_speed):
-            url = DEVICES_URL + "/" + thermostat.id
             try:
-                self._request_action(url, json.dumps(thermostat.data))
+                self._send_thermostat(thermostat)
                 return True
             except SpiderApiException:
+                thermostat.clear_pending("FanSpeed")
                 _LOGGER.error(
                     f"Unable to set fan speed to {fan_speed}. Is this fan speed supported?"
                 )
         return False
 
-    def update_power_plugs(self) -> None:
-        """ Retrieve power plugs """
-        results = self._request_update(ENERGY_DEVICES_URL)
+    def queue_temperature(
+        self, thermostat: SpiderThermostat, temperature: float
+    ) -> Future[bool]:
+        """ Set the temperature, sent together with other changes within the debounce window """
+        return self._commands.submit(
+            thermostat, lambda: thermostat.set_temperature(temperature)
+        )
 
-        if results is False:
-            return
+    def queue_operation_mode(
+        self, thermostat: SpiderThermostat, operation_mode: str
+    ) -> Future[bool]:
+        """ Set the operation mode, sent together with other changes within the debounce window """
+        return self._commands.submit(
+            thermostat, lambda: thermostat.set_operation_mode(operation_mode)
+        )
 
-        for power_plug in results:
-            if power_plug["isSwitch"]:
-                today = (
-                    datetime.today()
-                    .replace(hour=00, minute=00, second=00)
-                    .strftime("%s")
-                )
+    def queue_fan_speed(
+        self, thermostat: SpiderThermostat, fan_speed: str
+    ) -> Future[bool]:
+        """ Set the fan speed, sent together with other changes within the debounce window """
+        return self._commands.submit(
+            thermostat, lambda: thermostat.set_fan_speed(fan_speed)
+        )
+
+    def flush_commands(self) -> None:
+        """ Send all queued thermostat changes now """
+        self._commands.flush()
 
-                energy_url = (
-                    ENERGY_MONITORING_URL
-                    + "/"
-                    + power_plug["energyDeviceId"]
-                    + "/?take=96&start="
-                    + str(today)
-                    + "000"
+    def set_temperatures(
+        self, thermostats: Iterable[SpiderThermostat], temperature: float
+    ) -> BulkReport:
+        """ Set the temperature of many thermostats, with concurrent requests """
+
+        def set_temperature(thermostat: SpiderThermostat) -> None:
+            self._change_thermostat(
+                thermostat,
+                "SetpointTemperature",
+                lambda: thermostat.set_temperature(temperature),
+            )
+
+        return self._bulk(thermostats, set_temperature)
+
+    def set_operation_modes(
+        self, thermostats: Iterable[SpiderThermostat], operation_mode: str
+    ) -> BulkReport:
+        """ Set the operation mode of many thermostats, with concurrent requests """
+
+        def set_operation_mode(thermostat: SpiderThermostat) -> None:
+            self._change_thermostat(
+                thermostat,
+                "OperationMode",
+                lambda: thermostat.set_operation_mode(operation_mode),
+            )
+
+        return self._bulk(thermostats, set_operation_mode)
+
+    def _change_thermostat(
+        self, thermostat: SpiderThermostat, field: str, change: Callable[[], bool]
+    ) -> None:
+        if not change():
+            raise SpiderApiException(
+                f"Unable to change {field} of {thermostat.id}. Is it online and supported?"
+            )
+
+        try:
+            self._send_thermostat(thermostat)
+        except SpiderApiException:
+            thermostat.clear_pending(field)
+            raise
+
+    def _send_thermostat(self, thermostat: SpiderThermostat) -> None:
+        url = self._base_url + DEVICES_PATH + "/" + thermostat.id
+        self._request_action(url, self._json.dumps(thermostat.data), "thermostat")
+        self._expect_change("thermostats")
+
+    def update_power_plugs(self) -> DeviceChanges:
+        """ Retrieve power plugs and update the cached ones in place """
+        return self._single_flight.do("power_plugs", self._update_power_plugs)
+
+    def _update_power_plugs(self) -> DeviceChanges:
+        results = self._request_update(
+            self._base_url + ENERGY_DEVICES_PATH, "energy_devices", True
+        )
+
+        if results is None:
+            results = self._power_plug_results
+        else:
+            self._power_plug_results = results
+
+        # Copies, the cached power plugs keep their own data
+        power_plugs = [dict(plug) for plug in results if plug["isSwitch"]]
+        energy_requests = self._get_executor().map(
+            self._request_energy_usage, power_plugs
+        )
+
+        for power_plug, today_usage in zip(power_plugs, energy_requests):
+            if today_usage is None:
+                # Keep the usage of the previous refresh
+                previous = self._power_plugs.get(power_plug["id"])
+                if previous is not None and "todayUsage" in previous.data:
+                    power_plug["todayUsage"] = previous.data["todayUsage"]
+            else:
+                power_plug["todayUsage"] = today_usage
+
+        started = time.perf_counter()
+        self._power_plugs, changes = reconcile(
+            self._power_plugs,
+            {power_plug["id"]: power_plug for power_plug in power_plugs},
+            self._create_power_plug,
+        )
+        if self._metrics is not None:
+            self._metrics.stage("build", time.perf_counter() - started)
+        self._power_plugs_updated_at = datetime.now()
+        self._update_fleet()
+        self._refreshed("power_plugs", changes)
+        self._subscriptions.notify(self._power_plugs, changes)
+        self._subscriptions.refreshed("power_plugs", self._power_plugs.values())
+
+        return changes
+
+    def _request_energy_usage(self, power_plug: Dict[Any, Any]) -> float | None:
+        """ Retrieve the energy usage of a power plug since the previous refresh """
+        energy_device_id = power_plug["energyDeviceId"]
+        history = self._energy_history.setdefault(
+            energy_device_id, EnergyHistory(self._energy_retention)
+        )
+        now = int(time.time())
+
+        for start, take in history.windows(now):
+            energy_url = self._base_url + energy_monitoring_path(
+                energy_device_id, start, take
+            )
+            try:
+                energy = parse_total_energy(
+                    self._request_update(energy_url, "monitoring")
                 )
-                energy_results = self._request_update(energy_url)
+            except IndexError:
+                # No buckets yet, such as for the bucket that just opened
+                continue
+            except SpiderApiException as exception:
+                _LOGGER.error(
+                    f"Unable to get today energy usage of {energy_device_id}: {exception}"
+                )
+                return None
+
+            history.record(start, energy, take)
 
-                if energy_results is False:
-                    continue
+        return history.today(now)
 
-                try:
-                    power_plug["todayUsage"] = float(
-                        energy_results[0]["totalEnergy"]["normal"]
-                    ) + float(energy_results[0]["totalEnergy"]["low"])
-                except IndexError:
-                    _LOGGER.error("Unable to get today energy usage for power plug")
+    def _update_fleet(self) -> None:
+        if self._fleet is not None:
+            self._fleet.update(self._account, self._power_plugs.values())
 
-                self._power_plugs[power_plug["id"]] = SpiderPowerPlug(power_plug)
+    @staticmethod
+    def _has_pending(devices: Dict[Any, Any]) -> bool:
+        return any(device.pending for device in devices.values())
+
+    def _create_power_plug(self, data: Dict[Any, Any]) -> SpiderPowerPlug:
+        return SpiderPowerPlug(data, self._energy_history.get(data["energyDeviceId"]))
 
     def get_power_plugs(self) -> ValuesView[SpiderPowerPlug]:
         """ Get all power plugs """
-        self.update()
+        if self._refresh_on_read("power_plugs"):
+            self._refresh_for_read("power_plugs")
 
         return self._power_plugs.values()
 
     def get_power_plug(self, unique_id: str) -> SpiderPowerPlug | None:
         """ Get a power plug by id """
-        self.update()
+        if self._refresh_on_read("power_plugs"):
+            self._refresh_for_read("power_plugs")
 
         if unique_id in self._power_plugs:
             return self._power_plugs[unique_id]
@@ -176,9 +703,8 @@ class SpiderApi:
     def turn_power_plug_on(self, power_plug: SpiderPowerPlug) -> bool:
         """ Turn the power_plug on"""
         if power_plug.turn_on():
-            url = POWER_PLUGS_URL + "/" + power_plug.id + "/switch"
             try:
-                self._request_action(url, "true")
+                self._send_switch(power_plug)
                 return True
             except SpiderApiException:
                 _LOGGER.error("Unable to turn power plug on.")
@@ -187,134 +713,249 @@ class SpiderApi:
     def turn_power_plug_off(self, power_plug: SpiderPowerPlug) -> bool:
         """ Turn the power plug off"""
         if power_plug.turn_off():
-            url = POWER_PLUGS_URL + "/" + power_plug.id + "/switch"
             try:
-                self._request_action(url, "false")
+                self._send_switch(power_plug)
                 return True
             except SpiderApiException:
                 _LOGGER.error("Unable to turn power plug off.")
         return False
 
+    def turn_power_plugs_on(self, power_plugs: Iterable[SpiderPowerPlug]) -> BulkReport:
+        """ Turn many power plugs on, with concurrent requests """
+        return self._bulk(
+            power_plugs, lambda power_plug: self._switch(power_plug, True)
+        )
+
+    def turn_power_plugs_off(
+        self, power_plugs: Iterable[SpiderPowerPlug]
+    ) -> BulkReport:
+        """ Turn many power plugs off, with concurrent requests """
+        return self._bulk(
+            power_plugs, lambda power_plug: self._switch(power_plug, False)
+        )
+
+    def _switch(self, power_plug: SpiderPowerPlug, on: bool) -> None:
+        if not (power_plug.turn_on() if on else power_plug.turn_off()):
+            raise SpiderApiException(f"Unable to switch {power_plug.id}. Is it online?")
+
+        self._send_switch(power_plug)
+
+    def _send_switch(self, power_plug: SpiderPowerPlug) -> None:
+        url = self._base_url + POWER_PLUGS_PATH + "/" + power_plug.id + "/switch"
+        data = "true" if power_plug.is_on else "false"
+        try:
+            self._request_action(url, data, "power_plug_switch")
+        except SpiderApiException:
+            power_plug.clear_pending("isSwitchedOn")
+            raise
+
+        self._expect_change("power_plugs")
+
+    def _bulk(
+        self, devices: Iterable[DeviceType], action: Callable[[DeviceType], None]
+    ) -> BulkReport:
+        """ Perform the action for every device on the worker pool, collecting the outcome """
+        executor = self._get_executor()
+        futures = [(device, executor.submit(action, device)) for device in devices]
+
+        report = BulkReport()
+        for device, future in futures:
+            try:
+                future.result()
+                report.succeeded.append(device.id)
+            except Exception as exception:  # pylint: disable=broad-except
+                _LOGGER.error(f"Unable to update {device.id}: {exception}")
+                report.failed[device.id] = exception
+
+        return report
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """ Worker pool for concurrent requests, bounded by the energy concurrency """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._energy_concurrency,
+                thread_name_prefix="spiderpy",
+            )
+        return self._executor
+
     def _is_authenticated(self) -> bool:
-        """ Check if access token is expired """
-        if self._refresh_token == "":
-            self._request_login()
+        """ Check if access token is expired. Concurrent callers share one renewal """
+        return self._single_flight.do("token", self._renew_token)
+
+    def _renew_token(self) -> bool:
+        """ Renew the token ahead of expiry, unless another client already did """
+        if self._refresh_token != "" and not self._token_refresh_due():
+            return False
+
+        with self._token_store.lock():
+            token = self._token_store.load()
+            current_expiry = self._token_expires_at.timestamp()
+            if token is not None and token.expires_at > current_expiry:
+                self._access_token = token.access_token
+                self._refresh_token = token.refresh_token
+                self._token_expires_at = datetime.fromtimestamp(token.expires_at)
+
+            if self._refresh_token == "":
+                self._request_login()
+                renewal = "login"
+            elif self._token_refresh_due():
+                self._refresh_access_token()
+                renewal = "refresh"
+            else:
+                if self._metrics is not None:
+                    self._metrics.token_renewed("stored")
+                return False
+
+            if self._metrics is not None:
+                self._metrics.token_renewed(renewal)
+
+            self._token_store.save(
+                Token(
+                    self._access_token,
+                    self._refresh_token,
+                    self._token_expires_at.timestamp(),
+                )
+            )
 
-        if datetime.now() > self._token_expires_at:
-            self._refresh_access_token()
-            return True
+        return True
+
+    def _token_refresh_due(self) -> bool:
+        refresh_at = self._token_expires_at - timedelta(seconds=TOKEN_REFRESH_MARGIN)
+        return datetime.now() > refresh_at
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        endpoint: str,
+        error: Type[Exception] = SpiderApiException,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """ Send a request through the session, within the rate limit and circuit breaker
+
+        Raises error when the request could not be sent, and CircuitOpenException
+        while its circuit is open.
+        """
+        with self._circuits.request(method, endpoint) as exchange:
+            try:
+                response = self._session.request(
+                    method, url, timeout=self._timeout, **kwargs
+                )
+            except Exception as exception:
+                raise error(exception) from exception
 
-        return False
+            body = response.request.body
+            exchange.bytes_sent = len(body) if body is not None else 0
+            exchange.bytes_received = len(response.content)
+            exchange.status = response.status_code
 
-    def _request_action(self, url: str, data: str) -> None:
-        """ Perform a request to execute an action """
-        self._is_authenticated()
+        return response
 
-        headers = {
+    def _authorized_headers(self) -> Dict[str, str]:
+        """ Headers of a request with the access token, renewed when it is due """
+        self._is_authenticated()
+        return {
             "authorization": "Bearer " + self._access_token,
             "Content-Type": "application/json",
-            "X-Client-Platform": "android-phone",
-            "X-Client-Version": "1.5.9 (3611)",
-            "X-Client-Library": "SpiderPy",
+            **CLIENT_HEADERS,
         }
 
-        try:
-            response = requests.request("PUT", url, data=data, headers=headers)
-        except Exception as exception:
-            raise SpiderApiException(exception) from exception
+    def _request_action(self, url: str, data: str | bytes, endpoint: str) -> None:
+        """ Perform a request to execute an action """
+        headers = self._authorized_headers()
+        response = self._send("PUT", url, endpoint, data=data, headers=headers)
 
         if response.status_code == 401:
             raise SpiderApiException("Access denied. Failed to refresh?")
 
         if response.status_code != 200:
+            if isinstance(data, bytes):
+                data = data.decode()
             raise SpiderApiException(
                 f"Unable to perform action. Status code: {response.status_code}. Data: {data}"
             )
 
-    def _request_update(self, url: str) -> Dict[Any, Any]:
-        """ Perform a request to update information """
-        self._is_authenticated()
+    def _request_update(
+        self, url: str, endpoint: str, conditional: bool = False
+    ) -> Any:
+        """ Perform a request to update information
 
-        headers = {
-            "authorization": "Bearer " + self._access_token,
-            "Content-Type": "application/json",
-            "X-Client-Platform": "android-phone",
-            "X-Client-Version": "1.5.9 (3611)",
-            "X-Client-Library": "SpiderPy",
-        }
+        When conditional, None is returned if the response did not change since
+        the previous request.
+        """
+        headers = self._authorized_headers()
+        if conditional:
+            headers.update(self._conditional.headers(url))
 
-        try:
-            response = requests.request("GET", url, headers=headers)
-        except Exception as exception:
-            raise SpiderApiException(exception) from exception
+        response = self._send("GET", url, endpoint, headers=headers)
 
         if response.status_code == 401:
             raise SpiderApiException("Access denied. Failed to refresh?")
 
-        if response.status_code != 200:
+        if response.status_code not in (200, 304):
             raise SpiderApiException(
                 f"Unable to request update. Status code: {response.status_code}"
             )
 
-        return response.json()
+        if conditional:
+            unchanged = self._conditional.unchanged(
+                url, response.status_code, response.headers, response.content
+            )
+            if self._metrics is not None:
+                self._metrics.cache(endpoint, unchanged)
+            if unchanged:
+                return None
 
-    def _request_login(self) -> None:
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "X-Client-Platform": "android-phone",
-            "X-Client-Version": "1.5.9 (3611)",
-            "X-Client-Library": "SpiderPy",
-        }
+        if response.status_code == 304:
+            raise SpiderApiException(
+                "Unable to request update. Not modified, but no previous response"
+            )
 
+        if self._metrics is None:
+            return self._json.loads(response.content)
+
+        started = time.perf_counter()
+        results = self._json.loads(response.content)
+        self._metrics.stage("parse", time.perf_counter() - started)
+        return results
+
+    def _request_login(self) -> None:
         payload = {
             "grant_type": "password",
             "username": self._username,
             "password": self._password,
         }
-
-        try:
-            response = requests.request(
-                "POST", AUTHENTICATE_URL, data=payload, headers=headers
-            )
-        except Exception as exception:
-            raise UnauthorizedException(exception) from exception
-
-        if response.status_code != 200:
-            raise SpiderApiException(
-                f"Unable to request login. Status code: {response.status_code}"
-            )
-
-        data = response.json()
-        self._access_token = data["access_token"]
-        self._refresh_token = unquote(data["refresh_token"])
-        self._token_expires_in = data["expires_in"]
-        self._token_expires_at = datetime.now() + timedelta(
-            0, (int(data["expires_in"]) - 20)
-        )
+        self._request_token(payload, "request login", UnauthorizedException)
 
     def _refresh_access_token(self) -> None:
         """ Refresh access_token """
+        payload = {"grant_type": "refresh_token", "refresh_token": self._refresh_token}
+        self._request_token(payload, "refresh access token", SpiderApiException)
 
+    def _request_token(
+        self, payload: Dict[str, str], action: str, error: Type[Exception]
+    ) -> None:
+        """ Request a token, raising error when the request could not be sent """
         headers = {
             "Content-Type": "application/x-www-form-urlencoded",
-            "X-Client-Platform": "android-phone",
-            "X-Client-Version": "1.5.9 (3611)",
-            "X-Client-Library": "SpiderPy",
+            **CLIENT_HEADERS,
         }
 
-        payload = {"grant_type": "refresh_token", "refresh_token": self._refresh_token}
-
-        response = requests.request(
-            "POST", AUTHENTICATE_URL, data=payload, headers=headers
+        response = self._send(
+            "POST",
+            self._base_url + AUTHENTICATE_PATH,
+            "tokens",
+            error,
+            data=payload,
+            headers=headers,
         )
 
-        data = response.json()
-
         if response.status_code != 200:
             raise SpiderApiException(
-                f"Unable to refresh access token. Status code: {response.status_code}"
+                f"Unable to {action}. Status code: {response.status_code}"
             )
 
+        data = self._json.loads(response.content)
         self._access_token = data["access_token"]
         self._refresh_token = unquote(data["refresh_token"])
         self._token_expires_in = data["expires_in"]
@@ -323,9 +964,24 @@ class SpiderApi:
         )
 
 
-class UnauthorizedException(Exception):
-    pass
+def encode_username(username: str) -> str:
+    """ The API expects the username as a string of hex encoded characters """
+    encoded = ""
+    for char in username:
+        encoded += hex(ord(char)).lstrip("0x")
+    return encoded
 
 
-class SpiderApiException(Exception):
-    pass
+def thermostat_data(data: Dict[Any, Any]) -> Dict[Any, Any]:
+    """ Copy of a listed thermostat, so changes to the device leave the listing intact """
+    return {
+        **data,
+        "properties": [dict(prop) for prop in data.get("properties") or []],
+    }
+
+
+def seconds_since(updated_at: datetime | None) -> float | None:
+    if updated_at is None:
+        return None
+
+    return (datetime.now() - updated_at).total_seconds()
@@ -0,0 +1,91 @@
+""" Change notifications for the device cache """
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from spiderpy.changes import DeviceChanges
+from spiderpy.devices.base import SpiderDevice
+
+ChangeCallback = Callable[[SpiderDevice, str, Any, Any], None]
+RefreshCallback = Callable[[str, Iterable[SpiderDevice]], None]
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Subscriptions:
+    """ Callbacks per device and field, a device or field of None matches all
+
+    Listeners are called after every refresh instead, changed or not.
+    """
+
+    def __init__(self) -> None:
+        self._callbacks: Dict[Tuple[str | None, str | None], List[ChangeCallback]] = {}
+        self._listeners: List[RefreshCallback] = []
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self._callbacks)
+
+    def subscribe(
+        self,
+        callback: ChangeCallback,
+        device_id: str | None = None,
+        field: str | None = None,
+    ) -> Callable[[], None]:
+        """ Register a callback, returns a function to unsubscribe it """
+        key = (device_id, field)
+        with self._lock:
+            self._callbacks[key] = self._callbacks.get(key, []) + [callback]
+
+        def unsubscribe() -> None:
+            with self._lock:
+                callbacks = [
+                    c for c in self._callbacks.get(key, []) if c is not callback
+                ]
+                if callbacks:
+                    self._callbacks[key] = callbacks
+                else:
+                    self._callbacks.pop(key, None)
+
+        return unsubscribe
+
+    def listen(self, callback: RefreshCallback) -> Callable[[], None]:
+        """ Register a refresh listener, returns a function to remove it """
+        with self._lock:
+            self._listeners = self._listeners + [callback]
+
+        def unlisten() -> None:
+            with self._lock:
+                self._listeners = [c for c in self._listeners if c is not callback]
+
+        return unlisten
+
+    def refreshed(self, kind: str, devices: Iterable[SpiderDevice]) -> None:
+        """ Call the listeners with the devices of a refresh """
+        for callback in self._listeners:
+            try:
+                callback(kind, devices)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception(f"Error in refresh listener for {kind}")
+
+    def notify(self, devices: Dict[Any, Any], changes: DeviceChanges) -> None:
+        """ Call the callbacks for every changed field of the refreshed devices """
+        if not self._callbacks:
+            return
+
+        for device_id, fields in changes.changed.items():
+            device = devices[device_id]
+            for field, (old_value, new_value) in fields.items():
+                for key in (
+                    (device_id, field),
+                    (device_id, None),
+                    (None, field),
+                    (None, None),
+                ):
+                    for callback in self._callbacks.get(key, []):
+                        try:
+                            callback(device, field, old_value, new_value)
+                        except Exception:  # pylint: disable=broad-except
+                            _LOGGER.exception(f"Error in callback for {field}")
@@ -0,0 +1,100 @@
+""" Storage of the API tokens, to share them between clients and restarts """
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import ContextManager, Iterator
+
+
+@dataclass
+class Token:
+    access_token: str
+    refresh_token: str
+    expires_at: float
+
+
+class TokenStore(ABC):
+    """ Base class of the token stores
+
+    Clients hold the lock while they load, renew and save the token, so only one
+    of them renews it and the others pick up the result.
+    """
+
+    @abstractmethod
+    def lock(self) -> ContextManager[None]:
+        """ Context manager excluding the other clients of the store """
+
+    @abstractmethod
+    def load(self) -> Token | None:
+        """ The stored token, None when there is none """
+
+    @abstractmethod
+    def save(self, token: Token) -> None:
+        """ Store the token, replacing the previous one """
+
+
+class MemoryTokenStore(TokenStore):
+    """ Token store shared by the clients in this process """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._token: Token | None = None
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        with self._lock:
+            yield
+
+    def load(self) -> Token | None:
+        return self._token
+
+    def save(self, token: Token) -> None:
+        self._token = token
+
+
+class FileTokenStore(TokenStore):
+    """ Token store in a JSON file, shared between processes through a file lock
+
+    Relies on fcntl, so it is only available on POSIX systems.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._thread_lock = threading.RLock()
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        with self._thread_lock, open(
+            self._path + ".lock", "a", encoding="utf-8"
+        ) as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self) -> Token | None:
+        try:
+            with open(self._path, encoding="utf-8") as token_file:
+                return Token(**json.load(token_file))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, token: Token) -> None:
+        directory = os.path.dirname(os.path.abspath(self._path))
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as token_file:
+                json.dump(asdict(token), token_file)
+            os.chmod(temporary_path, 0o600)
+            os.replace(temporary_path, self._path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
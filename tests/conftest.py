@@ -0,0 +1,14 @@
+""" Fixtures shared by the tests, running against the local fake Spider API """
+from __future__ import annotations
+
+from typing import Iterator
+
+import pytest
+
+from spiderpy.fakeserver import FakeSpiderServer
+
+
+@pytest.fixture
+def server() -> Iterator[FakeSpiderServer]:
+    with FakeSpiderServer(thermostats=2, power_plugs=3, seed=0) as fake_server:
+        yield fake_server
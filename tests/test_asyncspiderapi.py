@@ -0,0 +1,115 @@
+""" AsyncSpiderApi against the local fake Spider API """
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+
+from spiderpy.asyncspiderapi import AsyncSpiderApi
+from spiderpy.fakeserver import FakeSpiderServer
+
+
+def run(
+    server: FakeSpiderServer, test: Callable[[AsyncSpiderApi], Awaitable[Any]]
+) -> Any:
+    async def with_api() -> Any:
+        async with AsyncSpiderApi("user", "password", base_url=server.url) as api:
+            return await test(api)
+
+    return asyncio.run(with_api())
+
+
+def test_lists_devices(server: FakeSpiderServer) -> None:
+    async def test(api: AsyncSpiderApi) -> None:
+        thermostats = await api.get_thermostats()
+        power_plugs = await api.get_power_plugs()
+
+        assert sorted(thermostat.id for thermostat in thermostats) == [
+            "thermostat-0",
+            "thermostat-1",
+        ]
+        assert len(power_plugs) == 3
+        assert all(
+            power_plug.today_energy_consumption > 0 for power_plug in power_plugs
+        )
+
+    run(server, test)
+    assert server.requests["tokens"] == 1
+
+
+def test_getters_use_the_cache(server: FakeSpiderServer) -> None:
+    async def test(api: AsyncSpiderApi) -> None:
+        thermostat = await api.get_thermostat("thermostat-1")
+        assert thermostat is not None and thermostat.name == "Thermostat 1"
+        assert await api.get_thermostat("missing") is None
+        await api.get_thermostats()
+
+    run(server, test)
+    assert server.requests["devices"] == 1
+
+
+def test_concurrent_reads_share_one_refresh(server: FakeSpiderServer) -> None:
+    async def test(api: AsyncSpiderApi) -> None:
+        await asyncio.gather(*[api.get_thermostats() for _ in range(10)])
+
+    run(server, test)
+    assert server.requests["devices"] == 1
+    assert server.requests["tokens"] == 1
+
+
+def test_set_temperature(server: FakeSpiderServer) -> None:
+    async def test(api: AsyncSpiderApi) -> None:
+        thermostat = await api.get_thermostat("thermostat-0")
+        assert thermostat is not None
+        assert await api.set_temperature(thermostat, 19.5)
+        assert thermostat.target_temperature == 19.5
+
+    run(server, test)
+    setpoint = server.thermostats["thermostat-0"]["properties"][1]
+    assert setpoint["status"] == "19.5"
+
+
+def test_switch_power_plug(server: FakeSpiderServer) -> None:
+    async def test(api: AsyncSpiderApi) -> None:
+        power_plug = await api.get_power_plug("plug-2")
+        assert power_plug is not None and power_plug.is_on
+        assert await api.turn_power_plug_off(power_plug)
+        assert not power_plug.is_on
+
+    run(server, test)
+    assert server.power_plugs["plug-2"]["isSwitchedOn"] is False
+
+
+def test_reports_changes(server: FakeSpiderServer) -> None:
+    async def test(api: AsyncSpiderApi) -> Any:
+        await api.update_thermostats()
+        server.change()
+        return await api.update_thermostats()
+
+    changes = run(server, test)
+    assert set(changes.changed) == {"thermostat-0", "thermostat-1"}
+    assert changes.changed["thermostat-0"]["AmbientTemperature"] == ("20.5", "20.6")
+
+
+def test_requests_time_out_on_a_passed_session(server: FakeSpiderServer) -> None:
+    async def test() -> None:
+        async with aiohttp.ClientSession() as session, AsyncSpiderApi(
+            "user",
+            "password",
+            base_url=server.url,
+            refresh_rate=0,
+            session=session,
+            timeout=0.1,
+        ) as api:
+            assert len(await api.get_thermostats()) == 2
+
+            server.latency = 1
+            started = time.monotonic()
+            assert len(await api.get_thermostats()) == 2
+
+            assert time.monotonic() - started < 0.5
+            assert api.stale
+
+    asyncio.run(test())
@@ -0,0 +1,41 @@
+""" Getters of clients refreshed in the background """
+from __future__ import annotations
+
+import asyncio
+
+from spiderpy.asyncspiderapi import AsyncSpiderApi
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import SpiderApi
+
+
+def test_first_read_waits_for_the_cache(server: FakeSpiderServer) -> None:
+    with SpiderApi("user", "password", base_url=server.url) as api:
+        api.start_background_refresh(60, 60)
+
+        assert api.get_thermostat("thermostat-0") is not None
+        assert len(api.get_thermostats()) == 2
+        assert len(api.get_power_plugs()) == 3
+
+
+def test_filled_cache_is_returned_right_away(server: FakeSpiderServer) -> None:
+    with SpiderApi("user", "password", base_url=server.url, refresh_rate=0) as api:
+        api.get_thermostats()
+        api.start_background_refresh(60, 60)
+        requests = server.requests["devices"]
+
+        for _ in range(5):
+            api.get_thermostats()
+
+        # At most the first background run, never one per read
+        assert server.requests["devices"] <= requests + 1
+
+
+def test_async_first_read_waits_for_the_cache(server: FakeSpiderServer) -> None:
+    async def test() -> None:
+        async with AsyncSpiderApi("user", "password", base_url=server.url) as api:
+            api.start_background_refresh(60, 60)
+
+            assert await api.get_thermostat("thermostat-0") is not None
+            assert len(await api.get_power_plugs()) == 3
+
+    asyncio.run(test())
@@ -0,0 +1,160 @@
+""" Circuit breakers and the last good devices served while the API fails """
+from __future__ import annotations
+
+import asyncio
+import time
+
+from spiderpy.asyncspiderapi import AsyncSpiderApi
+from spiderpy.circuitbreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import TIMEOUT, SpiderApi
+
+FAILURE_THRESHOLD = 3
+
+
+def storm_client(
+    server: FakeSpiderServer, reset_timeout: float, timeout: float = TIMEOUT
+) -> SpiderApi:
+    """ Client that neither retries nor caches between reads """
+    return SpiderApi(
+        "user",
+        "password",
+        base_url=server.url,
+        refresh_rate=0,
+        timeout=timeout,
+        retries=0,
+        failure_threshold=FAILURE_THRESHOLD,
+        reset_timeout=reset_timeout,
+    )
+
+
+def test_opens_after_consecutive_failures() -> None:
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    breaker.failed()
+    breaker.failed()
+    breaker.succeeded()
+    breaker.failed()
+    breaker.failed()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+    breaker.failed()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert 59 < breaker.retry_in() <= 60
+
+
+def test_failed_probe_doubles_reset_timeout() -> None:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.failed()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only a single probe at a time
+    assert not breaker.allow()
+
+    breaker.failed()
+    assert breaker.state == OPEN
+    assert 0.05 < breaker.retry_in() <= 0.1
+
+    time.sleep(0.11)
+    assert breaker.allow()
+    breaker.succeeded()
+    assert breaker.state == CLOSED
+
+    breaker.failed()
+    assert breaker.retry_in() <= 0.05
+
+
+def test_error_storm_serves_the_last_good_devices(server: FakeSpiderServer) -> None:
+    with storm_client(server, reset_timeout=60) as api:
+        temperatures = [
+            thermostat.current_temperature for thermostat in api.get_thermostats()
+        ]
+        assert not api.stale
+
+        server.error_rate = 1
+        for _ in range(10):
+            thermostats = api.get_thermostats()
+            assert [
+                thermostat.current_temperature for thermostat in thermostats
+            ] == temperatures
+
+        assert api.stale
+        assert api.circuits["devices"] == OPEN
+        # Once open, no more requests reach the failing API
+        assert server.requests["injected_errors"] == FAILURE_THRESHOLD
+
+
+def test_latency_storm_opens_the_circuit(server: FakeSpiderServer) -> None:
+    with storm_client(server, timeout=0.1, reset_timeout=60) as api:
+        assert len(api.get_power_plugs()) == 3
+
+        server.latency = 0.3
+        for _ in range(FAILURE_THRESHOLD):
+            assert len(api.get_power_plugs()) == 3
+        assert api.stale
+        assert api.circuits["energy"] == OPEN
+
+        started = time.monotonic()
+        for _ in range(10):
+            assert len(api.get_power_plugs()) == 3
+        assert time.monotonic() - started < 0.1
+
+
+def test_recovers_after_the_reset_timeout(server: FakeSpiderServer) -> None:
+    with storm_client(server, reset_timeout=0.2) as api:
+        temperatures = [
+            thermostat.current_temperature for thermostat in api.get_thermostats()
+        ]
+        server.error_rate = 1
+        for _ in range(FAILURE_THRESHOLD):
+            api.get_thermostats()
+        assert api.circuits["devices"] == OPEN
+
+        server.error_rate = 0
+        api.get_thermostats()
+        assert api.stale
+
+        time.sleep(0.25)
+        server.change()
+        thermostats = api.get_thermostats()
+
+        assert not api.stale
+        assert api.circuits["devices"] == CLOSED
+        assert [
+            thermostat.current_temperature for thermostat in thermostats
+        ] != temperatures
+
+
+def test_async_error_storm_serves_the_last_good_devices(
+    server: FakeSpiderServer,
+) -> None:
+    async def test() -> None:
+        async with AsyncSpiderApi(
+            "user",
+            "password",
+            base_url=server.url,
+            refresh_rate=0,
+            failure_threshold=FAILURE_THRESHOLD,
+            reset_timeout=60,
+        ) as api:
+            usage = [
+                power_plug.current_energy_consumption
+                for power_plug in await api.get_power_plugs()
+            ]
+
+            server.error_rate = 1
+            for _ in range(10):
+                power_plugs = await api.get_power_plugs()
+                assert [
+                    power_plug.current_energy_consumption for power_plug in power_plugs
+                ] == usage
+
+            assert api.stale
+            assert api.circuits["energy"] == OPEN
+            assert server.requests["injected_errors"] == FAILURE_THRESHOLD
+
+    asyncio.run(test())
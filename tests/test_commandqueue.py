@@ -0,0 +1,113 @@
+""" Thermostat changes coalesced into a single request per device """
+from __future__ import annotations
+
+from typing import Any, Set, Tuple
+
+import pytest
+
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import SpiderApi
+
+DEBOUNCE = 0.2
+TIMEOUT = 5
+
+
+@pytest.fixture(name="rejecting")
+def fixture_rejecting(
+    server: FakeSpiderServer, monkeypatch: pytest.MonkeyPatch
+) -> Set[str]:
+    """ Methods the server answers with a 500 """
+    rejected: Set[str] = set()
+    handle = server.handle
+
+    def reject(method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        if method in rejected:
+            return 500, {}
+        return handle(method, path, body)
+
+    monkeypatch.setattr(server, "handle", reject)
+    return rejected
+
+
+def client(server: FakeSpiderServer) -> SpiderApi:
+    return SpiderApi(
+        "user",
+        "password",
+        base_url=server.url,
+        refresh_rate=0,
+        retries=0,
+        command_debounce=DEBOUNCE,
+    )
+
+
+def test_changes_within_the_window_are_sent_once(server: FakeSpiderServer) -> None:
+    with client(server) as api:
+        thermostat = api.get_thermostat("thermostat-0")
+        assert thermostat is not None
+
+        futures = [
+            api.queue_temperature(thermostat, 19.0),
+            api.queue_operation_mode(thermostat, "Cool"),
+            api.queue_temperature(thermostat, 22.5),
+            api.queue_fan_speed(thermostat, "High"),
+        ]
+
+        assert [future.result(TIMEOUT) for future in futures] == [True] * 4
+        assert server.requests["thermostat"] == 1
+
+        stored = {
+            prop["id"]: prop["status"]
+            for prop in server.thermostats["thermostat-0"]["properties"]
+        }
+        assert stored["SetpointTemperature"] == "22.5"
+        assert stored["OperationMode"] == "Cool"
+        assert stored["FanSpeed"] == "High"
+
+
+def test_change_of_offline_thermostat_resolves_right_away(
+    server: FakeSpiderServer,
+) -> None:
+    server.thermostats["thermostat-0"]["isOnline"] = False
+    with client(server) as api:
+        thermostat = api.get_thermostat("thermostat-0")
+        assert thermostat is not None
+
+        future = api.queue_temperature(thermostat, 19.0)
+
+        assert future.done()
+        assert not future.result()
+
+
+def test_flush_sends_right_away(server: FakeSpiderServer) -> None:
+    with client(server) as api:
+        thermostat = api.get_thermostat("thermostat-1")
+        assert thermostat is not None
+
+        future = api.queue_temperature(thermostat, 18.0)
+        api.flush_commands()
+
+        assert future.done()
+        assert future.result()
+        assert server.requests["thermostat"] == 1
+
+
+def test_failed_request_restores_only_the_changes(
+    server: FakeSpiderServer, rejecting: Set[str]
+) -> None:
+    with client(server) as api:
+        thermostat = api.get_thermostat("thermostat-0")
+        assert thermostat is not None
+
+        rejecting.add("PUT")
+        future = api.queue_temperature(thermostat, 25.0)
+        assert thermostat.target_temperature == 25.0
+
+        # A refresh during the window
+        server.change()
+        api.update_thermostats()
+        assert thermostat.current_temperature == 20.6
+
+        assert not future.result(TIMEOUT)
+        assert thermostat.target_temperature == 21.0
+        assert thermostat.current_temperature == 20.6
+        assert not thermostat.pending
@@ -0,0 +1,47 @@
+""" Responses that did not change since the previous request """
+from __future__ import annotations
+
+from typing import Any
+from urllib.parse import urlparse
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from spiderpy.conditional import ConditionalCache
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import DEVICES_PATH, SpiderApi, SpiderApiException
+
+
+class NotModifiedAdapter(HTTPAdapter):
+    """ Answers every device listing with 304 Not Modified """
+
+    def send(  # type: ignore[override]
+        self, request: requests.PreparedRequest, *args: Any, **kwargs: Any
+    ) -> requests.Response:
+        response = super().send(request, *args, **kwargs)
+        if urlparse(request.url).path == DEVICES_PATH:
+            response.close()
+            response.status_code = 304
+            response._content = b""  # pylint: disable=protected-access
+        return response
+
+
+def test_recognises_the_previous_response() -> None:
+    cache = ConditionalCache()
+
+    assert not cache.unchanged("url", 200, {"ETag": '"a"'}, b"[]")
+    assert cache.headers("url") == {"If-None-Match": '"a"'}
+    assert cache.unchanged("url", 304, {}, b"")
+    assert cache.unchanged("url", 200, {}, b"[]")
+    assert not cache.unchanged("url", 200, {}, b"[{}]")
+
+
+def test_not_modified_without_previous_response(server: FakeSpiderServer) -> None:
+    assert not ConditionalCache().unchanged("url", 304, {}, b"")
+
+    session = requests.Session()
+    session.mount("http://", NotModifiedAdapter())
+    with SpiderApi("user", "password", base_url=server.url, session=session) as api:
+        with pytest.raises(SpiderApiException):
+            api.get_thermostats()
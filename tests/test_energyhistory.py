@@ -0,0 +1,70 @@
+""" Quarter-hour energy buckets, and the usage of before the first refresh """
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+
+from spiderpy.energyhistory import BUCKET_SIZE, RETENTION, EnergyHistory, day_start
+from spiderpy.fleet import FleetEnergy
+from spiderpy.snapshot import Snapshot, read_snapshot, write_snapshot
+
+NOW = int(datetime(2024, 3, 1, 10, 20).timestamp())
+MIDNIGHT = day_start(NOW)
+HOUR = int(datetime(2024, 3, 1, 10).timestamp())
+CURRENT = int(datetime(2024, 3, 1, 10, 15).timestamp())
+
+
+def first_refresh() -> EnergyHistory:
+    """ History after the first refresh, with 2.0 used up to the current bucket """
+    history = EnergyHistory()
+    windows = history.windows(NOW)
+    assert windows == [(MIDNIGHT, (CURRENT - MIDNIGHT) // BUCKET_SIZE), (CURRENT, 1)]
+
+    start, take = windows[0]
+    history.record(start, 2.0, take)
+    history.record(CURRENT, 0.25)
+    return history
+
+
+def test_backfill_counts_for_today() -> None:
+    history = first_refresh()
+
+    assert history.today(NOW) == 2.25
+    assert history.consumption(MIDNIGHT, NOW) == 2.25
+
+
+def test_backfill_is_left_out_of_buckets_and_hours() -> None:
+    history = first_refresh()
+    history.record(CURRENT + BUCKET_SIZE, 0.5)
+
+    assert list(history.between(MIDNIGHT, NOW + BUCKET_SIZE)) == [0.25, 0.5]
+    assert history.hourly(NOW) == {HOUR: 0.75}
+
+
+def test_fleet_bucket_stats_leave_out_backfill() -> None:
+    class PowerPlug:
+        id = "plug"
+        name = "plug"
+        current_energy_consumption = 0.0
+        today_energy_consumption = 2.25
+        energy_history = first_refresh()
+
+    fleet = FleetEnergy(use_numpy=False)
+    fleet.update("user", [PowerPlug()])  # type: ignore[list-item]
+
+    stats = fleet.bucket_stats(
+        datetime.fromtimestamp(MIDNIGHT), datetime.fromtimestamp(NOW)
+    )
+    assert stats["max"] == 0.25
+
+
+def test_snapshot_keeps_backfill(tmp_path: Path) -> None:
+    path = str(tmp_path / "snapshot")
+    write_snapshot(path, Snapshot.capture([], [], {"energy": first_refresh()}))
+
+    snapshot = read_snapshot(path)
+    assert snapshot is not None
+    history = snapshot.restore_energy_history(RETENTION)["energy"]
+
+    assert history.today(NOW) == 2.25
+    assert history.hourly(NOW) == {HOUR: 0.25}
@@ -0,0 +1,115 @@
+""" Telemetry export of the refreshed devices """
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from spiderpy.export import (
+    FIELDS,
+    RotatingFileSink,
+    StreamSink,
+    TelemetryExporter,
+    batched,
+)
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import SpiderApi
+
+
+class RecordingSink(StreamSink):
+    """ Stream sink remembering the size of every batch """
+
+    def __init__(self) -> None:
+        super().__init__(io.BytesIO())
+        self.batches: List[int] = []
+
+    def write(self, lines: List[bytes], header: bytes = b"") -> None:
+        self.batches.append(len(lines))
+        super().write(lines, header)
+
+
+def refresh(server: FakeSpiderServer, exporter: TelemetryExporter, times: int) -> None:
+    with SpiderApi("user", "password", base_url=server.url) as api:
+        exporter.attach(api, account="home")
+        for _ in range(times):
+            api.update_thermostats()
+            api.update_power_plugs()
+
+
+def test_ndjson_record_per_device(server: FakeSpiderServer) -> None:
+    stream = io.BytesIO()
+    with TelemetryExporter(StreamSink(stream)) as exporter:
+        refresh(server, exporter, 1)
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["type"] for record in records] == ["thermostat"] * 2 + [
+        "power_plug"
+    ] * 3
+    assert records[0]["account"] == "home"
+    assert records[0]["temperature"] == 20.5
+    assert records[0]["setpoint"] == 21.0
+    assert records[2]["is_on"] is True
+    assert records[2]["today_usage"] > 0
+
+
+def test_csv_stream_starts_with_one_header(server: FakeSpiderServer) -> None:
+    stream = io.BytesIO()
+    with TelemetryExporter(StreamSink(stream), "csv") as exporter:
+        refresh(server, exporter, 2)
+
+    rows = list(csv.reader(io.StringIO(stream.getvalue().decode())))
+    assert rows[0] == list(FIELDS)
+    assert rows.count(list(FIELDS)) == 1
+    assert len(rows) == 1 + 2 * 5
+
+
+def test_records_are_written_in_batches(server: FakeSpiderServer) -> None:
+    sink = RecordingSink()
+    with TelemetryExporter(sink, batch_size=2) as exporter:
+        refresh(server, exporter, 1)
+
+    assert sink.batches == [2, 2, 1]
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_unknown_format() -> None:
+    with pytest.raises(ValueError):
+        TelemetryExporter(StreamSink(io.BytesIO()), "xml")
+
+
+def test_rotating_file_keeps_backup_count(
+    server: FakeSpiderServer, tmp_path: Path
+) -> None:
+    path = str(tmp_path / "telemetry.csv")
+    sink = RotatingFileSink(path, max_bytes=400, backup_count=2)
+    with TelemetryExporter(sink, "csv", batch_size=1) as exporter:
+        refresh(server, exporter, 4)
+
+    files = sorted(os.listdir(tmp_path))
+    assert files == ["telemetry.csv", "telemetry.csv.1", "telemetry.csv.2"]
+    for name in files:
+        with open(tmp_path / name, encoding="utf-8") as export_file:
+            rows = list(csv.reader(export_file))
+        assert rows[0] == list(FIELDS)
+        assert rows.count(list(FIELDS)) == 1
+        assert os.path.getsize(tmp_path / name) <= 400
+
+
+def test_append_to_existing_file_without_header(
+    server: FakeSpiderServer, tmp_path: Path
+) -> None:
+    path = str(tmp_path / "telemetry.csv")
+    for _ in range(2):
+        with TelemetryExporter(RotatingFileSink(path), "csv") as exporter:
+            refresh(server, exporter, 1)
+
+    with open(path, encoding="utf-8") as export_file:
+        rows = list(csv.reader(export_file))
+    assert rows[0] == list(FIELDS)
+    assert rows.count(list(FIELDS)) == 1
+    assert len(rows) == 1 + 2 * 5
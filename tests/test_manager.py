@@ -0,0 +1,63 @@
+""" SpiderAccountManager against the local fake Spider API """
+from __future__ import annotations
+
+import time
+from typing import Any, List, Tuple
+
+import pytest
+
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.manager import SpiderAccountManager
+
+
+def test_first_read_waits_for_the_cache(server: FakeSpiderServer) -> None:
+    manager = SpiderAccountManager()
+    try:
+        manager.add_account("first", "password", base_url=server.url)
+        manager.add_account("second", "password", base_url=server.url)
+        manager.start()
+
+        thermostats = manager.get_thermostats()
+        assert [len(account) for account in thermostats.values()] == [2, 2]
+    finally:
+        manager.close()
+
+
+def test_accounts_stay_fresh_within_the_rate_limit(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    rate, burst, refresh_rate = 8.0, 5, 2
+    with FakeSpiderServer(thermostats=1, power_plugs=1, seed=0) as server:
+        sent: List[float] = []
+        handle = server.handle
+
+        def record(method: str, path: str, body: bytes) -> Tuple[int, Any]:
+            sent.append(time.monotonic())
+            return handle(method, path, body)
+
+        monkeypatch.setattr(server, "handle", record)
+
+        manager = SpiderAccountManager(
+            rate_limit=rate, rate_burst=burst, refresh_rate=refresh_rate
+        )
+        try:
+            usernames = [f"account-{index}" for index in range(4)]
+            for username in usernames:
+                manager.add_account(username, "password", base_url=server.url)
+            manager.start()
+            time.sleep(4)
+
+            for username in usernames:
+                api = manager.get_account(username)
+                assert api is not None
+                for age in (api.thermostats_age, api.power_plugs_age):
+                    assert age is not None and age <= refresh_rate + 1
+        finally:
+            manager.close()
+
+    assert server.requests["devices"] >= 2 * len(usernames)
+    assert len(sent) <= rate * (sent[-1] - sent[0]) + burst
+    # Every window of a second stays within the rate, after the initial burst
+    for index, started in enumerate(sent):
+        within = [at for at in sent[index:] if at < started + 1]
+        assert len(within) <= rate + burst
@@ -0,0 +1,56 @@
+""" Instrumentation hooks of both clients """
+from __future__ import annotations
+
+import asyncio
+
+from spiderpy.asyncspiderapi import AsyncSpiderApi
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.metrics import RequestStats
+from spiderpy.spiderapi import SpiderApi
+
+
+def sync_stats(server: FakeSpiderServer) -> RequestStats:
+    stats = RequestStats()
+    with SpiderApi(
+        "user", "password", base_url=server.url, refresh_rate=0, metrics=stats
+    ) as api:
+        api.get_thermostats()
+        api.get_thermostats()
+        for power_plug in api.get_power_plugs():
+            api.turn_power_plug_on(power_plug)
+
+    return stats
+
+
+def async_stats(server: FakeSpiderServer) -> RequestStats:
+    stats = RequestStats()
+
+    async def run() -> None:
+        async with AsyncSpiderApi(
+            "user", "password", base_url=server.url, refresh_rate=0, metrics=stats
+        ) as api:
+            await api.get_thermostats()
+            await api.get_thermostats()
+            for power_plug in await api.get_power_plugs():
+                await api.turn_power_plug_on(power_plug)
+
+    asyncio.run(run())
+    return stats
+
+
+def test_async_client_calls_the_same_hooks(server: FakeSpiderServer) -> None:
+    expected = sync_stats(server)
+    stats = async_stats(server)
+
+    assert stats.requests == expected.requests
+    assert stats.bytes_sent == expected.bytes_sent
+    assert stats.bytes_sent["tokens"] > 0
+    assert stats.bytes_sent["power_plug_switch"] > 0
+    assert stats.bytes_received == expected.bytes_received
+    assert stats.token_renewals == expected.token_renewals == {"login": 1}
+    assert stats.cache_hits == expected.cache_hits
+    assert stats.cache_misses == expected.cache_misses
+    assert stats.stage_counts == expected.stage_counts
+    assert sum(sum(counts) for counts in stats.latency.values()) == sum(
+        stats.requests.values()
+    )
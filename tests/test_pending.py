@@ -0,0 +1,101 @@
+""" Local changes kept until the server confirms them or they time out """
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Tuple
+
+import pytest
+
+from spiderpy.asyncspiderapi import AsyncSpiderApi
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import SpiderApi
+
+PENDING_TIMEOUT = 0.3
+
+
+@pytest.fixture
+def ignoring_server(
+    server: FakeSpiderServer, monkeypatch: pytest.MonkeyPatch
+) -> FakeSpiderServer:
+    """ A server accepting every change without applying it """
+    handle = server.handle
+
+    def ignore_changes(method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        if method == "PUT":
+            return 200, {}
+        return handle(method, path, body)
+
+    monkeypatch.setattr(server, "handle", ignore_changes)
+    return server
+
+
+def test_unconfirmed_temperature_reverts(ignoring_server: FakeSpiderServer) -> None:
+    with SpiderApi("user", "password", base_url=ignoring_server.url) as api:
+        thermostat = api.get_thermostat("thermostat-0")
+        assert thermostat is not None
+        thermostat.pending_timeout = PENDING_TIMEOUT
+
+        api.set_temperature(thermostat, 25.0)
+        api.update_thermostats()
+        assert thermostat.target_temperature == 25.0
+        assert thermostat.pending
+
+        time.sleep(PENDING_TIMEOUT)
+        api.update_thermostats()
+        assert thermostat.target_temperature == 21.0
+        assert not thermostat.pending
+
+        # Back on the cheap path once nothing is pending
+        api.update_thermostats()
+        assert thermostat.target_temperature == 21.0
+
+
+def test_confirmed_temperature_stays(server: FakeSpiderServer) -> None:
+    with SpiderApi("user", "password", base_url=server.url) as api:
+        thermostat = api.get_thermostat("thermostat-0")
+        assert thermostat is not None
+
+        api.set_temperature(thermostat, 25.0)
+        api.update_thermostats()
+        assert thermostat.target_temperature == 25.0
+        assert not thermostat.pending
+
+
+def test_unconfirmed_switch_reverts(ignoring_server: FakeSpiderServer) -> None:
+    with SpiderApi("user", "password", base_url=ignoring_server.url) as api:
+        power_plug = api.get_power_plug("plug-0")
+        assert power_plug is not None
+        power_plug.pending_timeout = PENDING_TIMEOUT
+
+        api.turn_power_plug_off(power_plug)
+        api.update_power_plugs()
+        assert not power_plug.is_on
+
+        time.sleep(PENDING_TIMEOUT)
+        api.update_power_plugs()
+        assert power_plug.is_on
+        assert not power_plug.pending
+
+
+def test_async_unconfirmed_temperature_reverts(
+    ignoring_server: FakeSpiderServer,
+) -> None:
+    async def test() -> None:
+        async with AsyncSpiderApi(
+            "user", "password", base_url=ignoring_server.url
+        ) as api:
+            thermostat = await api.get_thermostat("thermostat-0")
+            assert thermostat is not None
+            thermostat.pending_timeout = PENDING_TIMEOUT
+
+            await api.set_temperature(thermostat, 25.0)
+            await api.update_thermostats()
+            assert thermostat.target_temperature == 25.0
+
+            await asyncio.sleep(PENDING_TIMEOUT)
+            await api.update_thermostats()
+            assert thermostat.target_temperature == 21.0
+            assert not thermostat.pending
+
+    asyncio.run(test())
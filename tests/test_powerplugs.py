@@ -0,0 +1,120 @@
+""" Refreshing power plugs and their energy usage """
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict, Iterator, Set, Tuple
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from spiderpy.asyncspiderapi import AsyncSpiderApi
+from spiderpy.energyhistory import bucket_start, day_start
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import ENERGY_MONITORING_PATH, SpiderApi
+
+
+class EmptyBucketAdapter(HTTPAdapter):
+    """ Answers the monitoring of single buckets without any bucket """
+
+    def send(  # type: ignore[override]
+        self, request: requests.PreparedRequest, *args: Any, **kwargs: Any
+    ) -> requests.Response:
+        response = super().send(request, *args, **kwargs)
+        url = request.url or ""
+        if ENERGY_MONITORING_PATH in url and "take=1&" in url:
+            response.close()
+            response._content = b"[]"  # pylint: disable=protected-access
+        return response
+
+
+@pytest.fixture(name="failing")
+def fixture_failing() -> Set[str]:
+    """ Energy devices of which the monitoring fails """
+    return set()
+
+
+@pytest.fixture(name="five_plugs")
+def fixture_five_plugs(
+    failing: Set[str], monkeypatch: pytest.MonkeyPatch
+) -> Iterator[FakeSpiderServer]:
+    """ A server with five power plugs, failing the monitoring of failing """
+    with FakeSpiderServer(thermostats=0, power_plugs=5, seed=0) as server:
+        handle = server.handle
+
+        def fail_monitoring(method: str, path: str, body: bytes) -> Tuple[int, Any]:
+            monitoring = path.startswith(ENERGY_MONITORING_PATH + "/")
+            if monitoring and path.rstrip("/").rsplit("/", 1)[-1] in failing:
+                return 500, {}
+            return handle(method, path, body)
+
+        monkeypatch.setattr(server, "handle", fail_monitoring)
+        yield server
+
+
+def readings(power_plugs: Any) -> Dict[str, Tuple[float, float]]:
+    return {
+        power_plug.id: (
+            power_plug.current_energy_consumption,
+            power_plug.today_energy_consumption,
+        )
+        for power_plug in power_plugs
+    }
+
+
+def assert_refreshed(
+    before: Dict[str, Tuple[float, float]], after: Dict[str, Tuple[float, float]]
+) -> None:
+    """ Every power plug refreshed, the failing one keeping its usage of today """
+    assert before.keys() == after.keys()
+    for power_plug_id, (current, today) in after.items():
+        assert current == before[power_plug_id][0] + 0.5
+        assert today > 0
+    assert after["plug-3"][1] == before["plug-3"][1]
+
+
+def test_failing_energy_usage_of_one_plug(
+    five_plugs: FakeSpiderServer, failing: Set[str]
+) -> None:
+    with SpiderApi(
+        "user", "password", base_url=five_plugs.url, refresh_rate=0, retries=0
+    ) as api:
+        before = readings(api.get_power_plugs())
+
+        failing.add("energy-3")
+        five_plugs.change()
+        api.update_power_plugs()
+
+        assert_refreshed(before, readings(api.get_power_plugs()))
+
+
+def test_async_failing_energy_usage_of_one_plug(
+    five_plugs: FakeSpiderServer, failing: Set[str]
+) -> None:
+    async def test() -> None:
+        async with AsyncSpiderApi(
+            "user", "password", base_url=five_plugs.url, refresh_rate=0
+        ) as api:
+            before = readings(await api.get_power_plugs())
+
+            failing.add("energy-3")
+            five_plugs.change()
+            await api.update_power_plugs()
+
+            assert_refreshed(before, readings(await api.get_power_plugs()))
+
+    asyncio.run(test())
+
+
+def test_empty_bucket_keeps_the_other_usage(server: FakeSpiderServer) -> None:
+    now = int(time.time())
+    if bucket_start(now) == day_start(now):
+        pytest.skip("No usage from before the open bucket yet")
+
+    session = requests.Session()
+    session.mount("http://", EmptyBucketAdapter())
+    with SpiderApi("user", "password", base_url=server.url, session=session) as api:
+        for power_plug in api.get_power_plugs():
+            # Only the usage from midnight until the open bucket
+            assert power_plug.today_energy_consumption == 2.0
@@ -0,0 +1,71 @@
+""" Warm starts from a snapshot of the cached devices """
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import SpiderApi
+
+LATENCY = 0.2
+
+
+def saved_snapshot(server: FakeSpiderServer, tmp_path: Path) -> str:
+    """ Snapshot of the devices before the server changes them """
+    path = str(tmp_path / "snapshot")
+    with SpiderApi("user", "password", base_url=server.url) as api:
+        api.get_thermostats()
+        api.get_power_plugs()
+        api.save_snapshot(path)
+
+    server.change()
+    server.latency = LATENCY
+    return path
+
+
+def threads(prefix: str) -> int:
+    return sum(thread.name.startswith(prefix) for thread in threading.enumerate())
+
+
+def test_restore_serves_the_snapshot_until_refreshed(
+    server: FakeSpiderServer, tmp_path: Path
+) -> None:
+    path = saved_snapshot(server, tmp_path)
+
+    with SpiderApi("user", "password", base_url=server.url) as api:
+        started = time.monotonic()
+        assert api.restore_snapshot(path)
+        thermostats = api.get_thermostats()
+        power_plugs = api.get_power_plugs()
+
+        assert time.monotonic() - started < LATENCY
+        assert api.stale
+        assert len(thermostats) == 2
+        assert len(power_plugs) == 3
+        restored = [thermostat.current_temperature for thermostat in thermostats]
+
+        deadline = time.monotonic() + 5
+        while api.stale and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        assert not api.stale
+        assert [
+            thermostat.current_temperature for thermostat in api.get_thermostats()
+        ] != restored
+
+
+def test_close_waits_for_the_warm_start(
+    server: FakeSpiderServer, tmp_path: Path
+) -> None:
+    path = saved_snapshot(server, tmp_path)
+    workers = threads("spiderpy_")
+
+    api = SpiderApi("user", "password", base_url=server.url)
+    assert api.restore_snapshot(path)
+    api.close()
+
+    assert threads("spiderpy-warm-start") == 0
+    # The power plugs are left stale, instead of refreshed by a new pool after closing
+    assert api.stale
+    assert threads("spiderpy_") == workers
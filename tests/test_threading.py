@@ -0,0 +1,138 @@
+""" SpiderApi shared between threads """
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import pytest
+
+import spiderpy.spiderapi
+from spiderpy.changes import DeviceChanges
+from spiderpy.devices.base import SpiderDevice
+from spiderpy.fakeserver import FakeSpiderServer, fake_thermostat
+from spiderpy.spiderapi import SpiderApi
+
+THREADS = 16
+
+
+def run_threads(target: Callable[[int], Any]) -> List[BaseException]:
+    """ Run target(index) on THREADS threads started together, returns their errors """
+    barrier = threading.Barrier(THREADS)
+    errors: List[BaseException] = []
+
+    def run(index: int) -> None:
+        barrier.wait()
+        try:
+            target(index)
+        except BaseException as exception:  # pylint: disable=broad-except
+            errors.append(exception)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return errors
+
+
+def test_concurrent_first_reads_share_one_login(server: FakeSpiderServer) -> None:
+    with SpiderApi("user", "password", base_url=server.url) as api:
+        errors = run_threads(lambda index: api.get_thermostats())
+
+    assert not errors
+    assert server.requests["tokens"] == 1
+    assert server.requests["devices"] == 1
+
+
+def test_expired_token_is_renewed_once(server: FakeSpiderServer) -> None:
+    # Expires within the refresh margin, so the next request renews it
+    server.token_lifetime = 70
+    with SpiderApi("user", "password", base_url=server.url, refresh_rate=0) as api:
+        api.get_thermostats()
+        server.token_lifetime = 3600
+
+        errors = run_threads(lambda index: api.get_thermostats())
+
+    assert not errors
+    assert server.requests["tokens"] == 2
+
+
+def test_stress(server: FakeSpiderServer) -> None:
+    """ Reads, refreshes and changes from many threads keep the cache consistent """
+    with SpiderApi("user", "password", base_url=server.url, refresh_rate=0) as api:
+        thermostats = {
+            thermostat.id: thermostat for thermostat in api.get_thermostats()
+        }
+        power_plugs = {
+            power_plug.id: power_plug for power_plug in api.get_power_plugs()
+        }
+
+        def work(index: int) -> None:
+            choices = random.Random(index)
+            for _ in range(40):
+                action = choices.randrange(6)
+                if action == 0:
+                    assert len(api.get_thermostats()) == 2
+                elif action == 1:
+                    assert len(api.get_power_plugs()) == 3
+                elif action == 2:
+                    thermostat = api.get_thermostat(choices.choice(list(thermostats)))
+                    assert thermostat is not None
+                    api.set_temperature(thermostat, choices.choice([19.0, 20.0]))
+                elif action == 3:
+                    power_plug = api.get_power_plug(choices.choice(list(power_plugs)))
+                    assert power_plug is not None
+                    api.turn_power_plug_on(power_plug)
+                elif action == 4:
+                    api.update_thermostat(choices.choice(list(thermostats)))
+                else:
+                    server.change()
+
+        errors = run_threads(work)
+
+        assert not errors
+        assert server.requests["tokens"] == 1
+        # Refreshes updated the cached devices in place
+        for thermostat in api.get_thermostats():
+            assert thermostats[thermostat.id] is thermostat
+        for power_plug in api.get_power_plugs():
+            assert power_plugs[power_plug.id] is power_plug
+
+
+def test_single_read_during_listing_refresh(
+    server: FakeSpiderServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """ A thermostat read on its own is not lost when a listing refresh ends later """
+    reconcile = spiderpy.spiderapi.reconcile
+
+    def slow_listing(
+        devices: Dict[Any, Any],
+        results: Dict[Any, Dict[Any, Any]],
+        factory: Callable[[Dict[Any, Any]], SpiderDevice],
+    ) -> Tuple[Dict[Any, Any], DeviceChanges]:
+        if len(results) > 1:
+            time.sleep(0.3)
+        return reconcile(devices, results, factory)
+
+    with SpiderApi("user", "password", base_url=server.url) as api:
+        api.update_thermostats()
+        monkeypatch.setattr(spiderpy.spiderapi, "reconcile", slow_listing)
+
+        server.change()
+        listing = threading.Thread(target=api.update_thermostats)
+        listing.start()
+        time.sleep(0.1)
+
+        server.thermostats["thermostat-2"] = fake_thermostat(2)
+        api.update_thermostat("thermostat-2")
+        listing.join()
+
+        api.refresh_on_read = False
+        assert sorted(thermostat.id for thermostat in api.get_thermostats()) == [
+            "thermostat-0",
+            "thermostat-1",
+            "thermostat-2",
+        ]
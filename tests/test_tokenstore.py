@@ -0,0 +1,43 @@
+""" Token stores shared between clients """
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from spiderpy.fakeserver import FakeSpiderServer
+from spiderpy.spiderapi import SpiderApi
+from spiderpy.tokenstore import FileTokenStore, Token, TokenStore
+
+
+class LockOnlyStore(TokenStore):
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        yield
+
+
+def test_stores_implement_every_method() -> None:
+    with pytest.raises(TypeError):
+        TokenStore()  # type: ignore[abstract]  # pylint: disable=abstract-class-instantiated
+    with pytest.raises(TypeError):
+        LockOnlyStore()  # type: ignore[abstract]  # pylint: disable=abstract-class-instantiated
+
+
+def test_file_store_is_shared_between_clients(
+    server: FakeSpiderServer, tmp_path: Path
+) -> None:
+    path = str(tmp_path / "token.json")
+    assert FileTokenStore(path).load() is None
+
+    for _ in range(2):
+        with SpiderApi(
+            "user", "password", base_url=server.url, token_store=FileTokenStore(path)
+        ) as api:
+            api.get_thermostats()
+
+    token = FileTokenStore(path).load()
+    assert isinstance(token, Token)
+    assert token.access_token == "fake-access-token"
+    assert server.requests["tokens"] == 1